@@ -0,0 +1,90 @@
+from panda3d.core import NodePath, PandaNode, GeomNode, SequenceNode, Thread
+from panda3d.core import GeomVertexData, GeomVertexFormat, GeomVertexAnimationSpec
+from panda3d.core import Filename, VirtualFileSystem, ConfigVariableString
+from panda3d.core import get_model_path
+from direct.actor.Actor import Actor
+
+
+# Baked loops are kept here as bam files and used for as long as the
+# model they came from does not change.
+CACHE = ConfigVariableString("gridfly-bake-cache", "$USER_APPDATA/gridfly/baked")
+
+
+def static_data(vdata):
+    # The vertices as the current pose puts them, without the columns
+    # and tables that would animate them again.
+    animated = vdata.animate_vertices(True, Thread.get_current_thread())
+    fmt = GeomVertexFormat(animated.get_format())
+    if fmt.has_column("transform_blend"):
+        fmt.remove_column("transform_blend")
+    fmt.remove_empty_arrays()
+    fmt.set_animation(GeomVertexAnimationSpec())
+    static = GeomVertexData(animated.convert_to(GeomVertexFormat.register_format(fmt)))
+    static.clear_transform_blend_table()
+    static.clear_transform_table()
+    static.clear_slider_table()
+    return static
+
+
+def pose(actor, anim, frame):
+    actor.pose(anim, frame)
+    actor.update(force=True)
+
+
+def bake_frames(actor, anim):
+    # A SequenceNode with the actor's geometry in every frame of anim.
+    sequence = SequenceNode(anim)
+    for frame in range(actor.get_num_frames(anim)):
+        pose(actor, anim, frame)
+        root = NodePath("frame-"+str(frame))
+        for path in actor.find_all_matches("**/+GeomNode"):
+            node = GeomNode(path.name)
+            for i in range(path.node().get_num_geoms()):
+                geom = path.node().get_geom(i).make_copy()
+                geom.set_vertex_data(static_data(geom.get_vertex_data()))
+                node.add_geom(geom, path.node().get_geom_state(i))
+            copy = root.attach_new_node(node)
+            copy.set_transform(path.get_transform(actor))
+            copy.set_state(path.get_state(actor))
+        root.flatten_strong()
+        sequence.add_child(root.node())
+    sequence.set_frame_rate(actor.get_frame_rate(anim))
+    return NodePath(sequence)
+
+
+def bake_joint(actor, anim, joint):
+    # A SequenceNode with an empty node per frame of anim, where the
+    # joint is in that frame. What follows the joint is instanced under
+    # every one of them.
+    exposed = actor.expose_joint(None, "modelRoot", joint)
+    sequence = SequenceNode(joint)
+    for frame in range(actor.get_num_frames(anim)):
+        pose(actor, anim, frame)
+        node = PandaNode("frame-"+str(frame))
+        node.set_transform(exposed.get_transform(actor))
+        sequence.add_child(node)
+    sequence.set_frame_rate(actor.get_frame_rate(anim))
+    return NodePath(sequence)
+
+
+def baked(assets, name, anim, joint=None, rate=1):
+    # The looping anim of a model the assets loaded, baked the first time
+    # and read from the cache after that. Playing it back costs nothing
+    # per frame, however often it is instanced.
+    path = Filename(assets.paths[name])
+    VirtualFileSystem.get_global_ptr().resolve_filename(path, get_model_path().get_value())
+    cache = None
+    if CACHE.get_value():
+        cache = Filename.expand_from("{}/{}-{}.bam".format(CACHE.get_value(), name, joint or anim))
+    if cache and cache.exists() and cache.compare_timestamps(path) >= 0:
+        node = loader.load_model(cache, noCache=True)
+    else:
+        actor = Actor(assets.get(name))
+        node = bake_joint(actor, anim, joint) if joint else bake_frames(actor, anim)
+        actor.cleanup()
+        if cache:
+            cache.make_dir()
+            node.write_bam_file(cache)
+    node.node().set_play_rate(rate)
+    node.node().loop(True)
+    return node
@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import traceback
+import multiprocessing
+
+import numpy
+
+
+# Runs many scripted headless games of the real game code over a pool
+# of processes, one game per job, for tuning make_enemies. Every job
+# has its own seed, so results don't depend on which worker ran it.
+#
+# Results stream into a directory with one raw little endian file per
+# column, plus columns.json describing them. The score curve is ragged:
+# curve holds all samples and curve_end where each game's samples end.
+COLUMNS = (
+    ("job", "<i4"),
+    ("seed", "<i8"),
+    ("segment_time", "<f8"),
+    ("length", "<i4"),
+    ("chaser_speed", "<f8"),
+    ("ticks", "<i4"),
+    ("level", "<i4"),
+    ("wave", "<i4"),
+    ("score", "<i8"),
+    ("tick_ms", "<f8"),
+    ("tick_p95_ms", "<f8"),
+    ("curve_end", "<i8"),
+)
+CURVE = ("curve", "<i8")
+SAMPLE_EVERY = 600
+
+
+class Results():
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.files = {}
+        for name, dtype in COLUMNS+(CURVE,):
+            self.files[name] = open(os.path.join(path, name+".bin"), "wb")
+        with open(os.path.join(path, "columns.json"), "w") as f:
+            json.dump(dict(COLUMNS+(CURVE,)), f, indent=2)
+        self.samples = 0
+        self.rows = 0
+
+    def append(self, row):
+        curve = row.pop("curve")
+        self.samples += len(curve)
+        row["curve_end"] = self.samples
+        self.files["curve"].write(numpy.array(curve, CURVE[1]).tobytes())
+        for name, dtype in COLUMNS:
+            self.files[name].write(numpy.array([row[name]], dtype).tobytes())
+        self.rows += 1
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+def read_results(path):
+    with open(os.path.join(path, "columns.json")) as f:
+        columns = json.load(f)
+    return {name: numpy.fromfile(os.path.join(path, name+".bin"), dtype)
+        for name, dtype in columns.items()}
+
+
+def wander(seed):
+    # A player that picks a new direction every half second and always
+    # respawns, its own Random so it never touches the game's.
+    bot = random.Random(seed)
+    moves = {}
+    def script(tick):
+        step = tick//30
+        if not step in moves:
+            moves.clear()
+            moves[step] = (bot.uniform(-1, 1), bot.uniform(-1, 1))
+        return moves[step], True
+    return script
+
+
+app = None
+fresh = None
+failed = None
+
+
+def start_worker(main_dir):
+    # Every game starts from the state of a fresh worker, whatever the
+    # game before it left behind.
+    global app, fresh, failed
+    try:
+        from panda3d.core import ExecutionEnvironment
+        # Spawned workers don't know where the game is, and pman looks
+        # for its config from the working directory.
+        os.chdir(main_dir)
+        ExecutionEnvironment.set_environment_variable("MAIN_DIR", main_dir)
+        import main
+        from replay import save_state
+        app = main.GameApp(headless=True, seed=0)
+        app.start()
+        fresh = save_state(app)
+    except Exception:
+        # The pool would replace a worker whose initializer raised, over
+        # and over. Its first job raises instead, which ends the run.
+        failed = traceback.format_exc()
+
+
+def play(job):
+    if failed:
+        raise RuntimeError("the worker failed to start:\n"+failed)
+    import rng
+    from headless import ScriptedInput
+    from replay import load_state
+    number, seed, segment_time, length, chaser_speed, max_ticks = job
+    load_state(app, fresh)
+    app.difficulty.update(segment_time=segment_time, length=length, chaser_speed=chaser_speed)
+    app.input = ScriptedInput(wander(seed))
+    rng.seed(seed)
+    app.start()
+    times = []
+    curve = []
+    clock = time.perf_counter
+    for tick in range(max_ticks):
+        if tick%SAMPLE_EVERY == 0:
+            curve.append(app.score)
+        start = clock()
+        app.task_mgr.step()
+        times.append(clock()-start)
+        if app.lives == 0 and not app.player.alive:
+            break
+    times.sort()
+    return {
+        "job": number,
+        "seed": seed,
+        "segment_time": segment_time,
+        "length": length,
+        "chaser_speed": chaser_speed,
+        "ticks": len(times),
+        "level": app.level,
+        "wave": app.wave,
+        "score": app.score,
+        "tick_ms": sum(times)/len(times)*1000,
+        "tick_p95_ms": times[int(len(times)*0.95)]*1000,
+        "curve": curve,
+    }
+
+
+def floats(text):
+    return [float(value) for value in text.split(",")]
+
+
+def ints(text):
+    return [int(value) for value in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out", help="directory for the results columns")
+    parser.add_argument("--segment-time", type=floats, default=[0.1])
+    parser.add_argument("--length", type=ints, default=[4])
+    parser.add_argument("--chaser-speed", type=floats, default=[1])
+    parser.add_argument("--games", type=int, default=10, help="games per combination")
+    parser.add_argument("--max-ticks", type=int, default=60*60*10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    combinations = itertools.product(args.segment_time, args.length, args.chaser_speed)
+    jobs = []
+    for combination in combinations:
+        for game in range(args.games):
+            number = len(jobs)
+            jobs.append((number, args.seed*1000003+number, *combination, args.max_ticks))
+
+    from panda3d.core import ExecutionEnvironment
+    main_dir = ExecutionEnvironment.get_environment_variable("MAIN_DIR")
+    results = Results(args.out)
+    # Panda runs threads of its own, new processes are safer than forks.
+    context = multiprocessing.get_context("spawn")
+    started = time.perf_counter()
+    ticks = 0
+    try:
+        with context.Pool(args.workers, initializer=start_worker,
+                initargs=(main_dir,)) as pool:
+            for row in pool.imap_unordered(play, jobs):
+                ticks += row["ticks"]
+                results.append(row)
+                print("{}/{} games, {:.0f} ticks/s".format(
+                    results.rows, len(jobs), ticks/(time.perf_counter()-started)),
+                    end="\r", file=sys.stderr)
+    finally:
+        results.close()
+        print(file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
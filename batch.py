@@ -0,0 +1,142 @@
+import numpy
+
+from panda3d.core import NodePath, GeomNode, Geom, GeomTriangles
+from panda3d.core import GeomVertexData, GeomVertexFormat, GeomVertexArrayFormat
+from panda3d.core import InternalName, OmniBoundingVolume
+
+
+COLUMNS = (
+    (InternalName.get_vertex(), 3, Geom.C_point),
+    (InternalName.get_normal(), 3, Geom.C_normal),
+    (InternalName.get_color(), 4, Geom.C_color),
+    (InternalName.get_texcoord(), 2, Geom.C_texcoord),
+)
+
+
+def float_format(source):
+    # Same columns as the source, but all float32 in one interleaved
+    # array so numpy can write them directly.
+    array = GeomVertexArrayFormat()
+    for name, amount, contents in COLUMNS:
+        if source.has_column(name):
+            array.add_column(name, amount, Geom.NT_float32, contents)
+    return GeomVertexFormat.register_format(GeomVertexFormat(array))
+
+
+class BatchPart():
+    # One Geom of a model, repeated once for every instance.
+    def __init__(self, geom):
+        geom = geom.decompose()
+        fmt = float_format(geom.get_vertex_data().get_format())
+        vdata = geom.get_vertex_data().convert_to(fmt)
+        stride = fmt.get_array(0).get_stride()//4
+        self.rows = numpy.frombuffer(vdata.get_array(0), numpy.float32).reshape(-1, stride).copy()
+        self.vertex = fmt.get_column(InternalName.get_vertex()).get_start()//4
+        self.normal = None
+        if fmt.has_column(InternalName.get_normal()):
+            self.normal = fmt.get_column(InternalName.get_normal()).get_start()//4
+        indices = []
+        for p in range(geom.get_num_primitives()):
+            prim = geom.get_primitive(p)
+            if isinstance(prim, GeomTriangles):
+                for i in range(prim.get_num_vertices()):
+                    indices.append(prim.get_vertex(i))
+        self.indices = numpy.array(indices, numpy.uint32)
+        self.points = self.rows[:, self.vertex:self.vertex+3]
+        self.count = -1
+        self.capacity = 0
+
+        self.vdata = GeomVertexData("batch", fmt, Geom.UH_dynamic)
+        self.prim = GeomTriangles(Geom.UH_dynamic)
+        self.prim.set_index_type(Geom.NT_uint32)
+        self.geom = Geom(self.vdata)
+        self.geom.add_primitive(self.prim)
+        self.geom.set_bounds(OmniBoundingVolume())
+
+    def grow(self, amount):
+        capacity = max(16, self.capacity)
+        while capacity < amount:
+            capacity *= 2
+        rows = len(self.rows)
+        self.buffer = numpy.tile(self.rows, (capacity, 1)).reshape(capacity, rows, -1)
+        offsets = (numpy.arange(capacity, dtype=numpy.uint32)*rows)[:, None]
+        self.all_indices = (self.indices[None, :]+offsets).reshape(-1)
+        self.capacity = capacity
+        self.count = -1
+
+    def write(self, x, y, z, c, s, sx, sy, sz):
+        n = len(x)
+        if n > self.capacity:
+            self.grow(n)
+        out = self.buffer[:n]
+        px = self.points[:, 0]*sx[:, None]
+        py = self.points[:, 1]*sy[:, None]
+        pz = self.points[:, 2]*sz[:, None]
+        v = self.vertex
+        out[:, :, v] = px*c[:, None] - py*s[:, None] + x[:, None]
+        out[:, :, v+1] = px*s[:, None] + py*c[:, None] + y[:, None]
+        out[:, :, v+2] = pz + z[:, None]
+        if self.normal is not None:
+            nx = self.rows[:, self.normal]
+            ny = self.rows[:, self.normal+1]
+            out[:, :, self.normal] = nx*c[:, None] - ny*s[:, None]
+            out[:, :, self.normal+1] = nx*s[:, None] + ny*c[:, None]
+        self.vdata.modify_array_handle(0).copy_data_from(out.reshape(-1))
+        if n != self.count:
+            self.prim.modify_vertices().modify_handle().copy_data_from(
+                self.all_indices[:n*len(self.indices)])
+            self.count = n
+
+
+class InstanceBatch():
+    # Draws every instance of a model as one Geom per render state. The
+    # instance transforms are baked into a shared vertex buffer with
+    # numpy, so this works the same on the software renderer.
+    def __init__(self, model, parent):
+        flat = NodePath("flat")
+        model.copy_to(flat)
+        flat.flatten_strong()
+        self.node = parent.attach_new_node(GeomNode("batch-"+model.name))
+        self.node.node().set_bounds(OmniBoundingVolume())
+        self.node.node().set_final(True)
+        self.parts = []
+        for geom_np in flat.find_all_matches("**/+GeomNode"):
+            geom_node = geom_np.node()
+            for g in range(geom_node.get_num_geoms()):
+                state = geom_np.get_net_state().compose(geom_node.get_geom_state(g))
+                part = BatchPart(geom_node.get_geom(g))
+                if len(part.indices):
+                    self.parts.append(part)
+                    self.node.node().add_geom(part.geom, state)
+
+    def draw(self, transforms):
+        # transforms is an (n, 7) array of x, y, z, heading, sx, sy, sz.
+        if len(transforms) == 0:
+            self.node.hide()
+            return
+        self.node.show()
+        x, y, z, h, sx, sy, sz = transforms.T
+        radians = numpy.radians(h)
+        c = numpy.cos(radians)
+        s = numpy.sin(radians)
+        for part in self.parts:
+            part.write(x, y, z, c, s, sx, sy, sz)
+
+
+class Batcher():
+    def __init__(self, parent):
+        self.parent = parent
+        self.batches = {}
+
+    def draw(self, groups):
+        # groups maps a model to the NodePaths that should show it.
+        for model, nodes in groups.items():
+            if not model in self.batches:
+                self.batches[model] = InstanceBatch(model, self.parent)
+            transforms = numpy.array(
+                [(*n.get_pos(), n.get_h(), *n.get_scale()) for n in nodes],
+                numpy.float32).reshape(-1, 7)
+            self.batches[model].draw(transforms)
+        for model, batch in self.batches.items():
+            if not model in groups:
+                batch.draw(())
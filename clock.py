@@ -0,0 +1,64 @@
+class SimClock():
+    # Fixed rate clock for everything in objects.py. Every rendered frame
+    # adds its real dt, advance() says how many whole ticks to run and
+    # what is left over becomes alpha, for drawing between two ticks.
+    def __init__(self, rate=60, max_ticks=8):
+        self.rate = rate
+        self.dt = 1/rate
+        self.max_ticks = max_ticks
+        self.accumulator = 0
+        self.alpha = 0
+        self.tick = 0
+        self.skipped = 0
+
+    def advance(self, frame_dt):
+        self.accumulator += frame_dt
+        ticks = int(self.accumulator*self.rate+1e-6)
+        if ticks > self.max_ticks:
+            # Too far behind (a hitch, the window being dragged), drop
+            # the time instead of trying to catch up.
+            self.skipped += ticks-self.max_ticks
+            ticks = self.max_ticks
+            self.accumulator = ticks*self.dt
+        self.accumulator = max(0, self.accumulator-ticks*self.dt)
+        self.alpha = min(1, self.accumulator*self.rate)
+        return ticks
+
+    def hold(self, ticks):
+        # Gives back ticks that could not run yet, they come again with
+        # the next advance().
+        self.accumulator += ticks*self.dt
+
+
+class Interpolator():
+    # Moving nodes are drawn between where they were before and after
+    # the last tick. Before the next tick they are put back where the
+    # simulation left them, unless something else moved them meanwhile.
+    def __init__(self):
+        self.previous = {}
+        self.current = []
+
+    def restore(self):
+        for node, pos, shown in self.current:
+            if not node.is_empty() and node.get_pos() == shown:
+                node.set_pos(pos)
+        self.current = []
+
+    def before_tick(self, nodes):
+        self.previous = {node: node.get_pos() for node in nodes}
+
+    def after_tick(self, nodes):
+        self.current = [(node, node.get_pos(), None) for node in nodes]
+
+    def blend(self, alpha):
+        current = []
+        for node, pos, shown in self.current:
+            previous = self.previous.get(node)
+            if previous is not None:
+                shown = previous+(pos-previous)*alpha
+                node.set_pos(shown)
+                shown = node.get_pos()
+            else:
+                shown = pos
+            current.append((node, pos, shown))
+        self.current = current
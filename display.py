@@ -0,0 +1,43 @@
+from panda3d.core import Filename, WindowProperties, ConfigVariableString
+from panda3d.core import load_prc_file
+
+
+# The window size picked on the first run is kept in this prc file and
+# loaded before the window opens, so later runs open at the right size
+# and don't ask the driver for its modes. Delete it to pick again.
+CACHE = ConfigVariableString("gridfly-display-cache", "$USER_APPDATA/gridfly/display.prc")
+
+
+def cache_file():
+    if not CACHE.get_value():
+        return None
+    return Filename.expand_from(CACHE.get_value())
+
+
+def load_display_mode():
+    filename = cache_file()
+    if filename and filename.exists():
+        load_prc_file(filename)
+        return True
+    return False
+
+
+def pick_display_mode(win, pipe):
+    # The last mode the driver lists, usually the largest.
+    info = pipe.getDisplayInformation()
+    count = info.getTotalDisplayModes()
+    if count == 0:
+        return
+    width = info.getDisplayModeWidth(count-1)
+    height = info.getDisplayModeHeight(count-1)
+    wp = WindowProperties()
+    wp.set_size(width, height)
+    win.requestProperties(wp)
+    filename = cache_file()
+    if filename:
+        try:
+            filename.make_dir()
+            with open(filename.to_os_specific(), "w") as f:
+                f.write("win-size {} {}\n".format(width, height))
+        except OSError:
+            pass
@@ -0,0 +1,112 @@
+import math
+
+
+class SpatialGrid():
+    # Uniform grid over the play field. Every kind of entity (segments,
+    # mines) gets its own layer of cells. Entities outside the
+    # field are kept in the border cells, so queries never miss them.
+    def __init__(self, map_size, cell_size=2):
+        xsize, ysize = map_size
+        self.cell_size = cell_size
+        self.x0 = -xsize
+        self.y0 = 0
+        self.columns = int(math.ceil((xsize*2)/cell_size))
+        self.rows = int(math.ceil(ysize/cell_size))
+        self.layers = {}
+        self.cells = {}
+        self.order = 0
+        # Entities looked at by queries, for telemetry.
+        self.tested = 0
+
+    def cell(self, x, y):
+        cx = int((x-self.x0)//self.cell_size)
+        cy = int((y-self.y0)//self.cell_size)
+        if cx < 0: cx = 0
+        elif cx >= self.columns: cx = self.columns-1
+        if cy < 0: cy = 0
+        elif cy >= self.rows: cy = self.rows-1
+        return cy*self.columns + cx
+
+    def layer(self, kind):
+        if not kind in self.layers:
+            self.layers[kind] = [dict() for i in range(self.columns*self.rows)]
+        return self.layers[kind]
+
+    def clear(self, kind=None):
+        kinds = [kind] if kind else list(self.layers)
+        for kind in kinds:
+            for cell in self.layer(kind):
+                cell.clear()
+            for entity in [e for e in self.cells if self.cells[e][0] == kind]:
+                del self.cells[entity]
+
+    def insert(self, kind, entity, pos):
+        x, y = pos[0], pos[1]
+        c = self.cell(x, y)
+        self.order += 1
+        self.layer(kind)[c][entity] = [self.order, x, y]
+        self.cells[entity] = (kind, c)
+
+    def remove(self, entity):
+        if entity in self.cells:
+            kind, c = self.cells.pop(entity)
+            del self.layers[kind][c][entity]
+
+    def entry(self, entity):
+        # The live [order, x, y] of an entity, for saving and restoring
+        # it exactly.
+        kind, c = self.cells[entity]
+        return self.layers[kind][c][entity]
+
+    def move(self, entity, pos):
+        kind, c = self.cells[entity]
+        x, y = pos[0], pos[1]
+        n = self.cell(x, y)
+        cells = self.layers[kind]
+        entry = cells[c][entity]
+        entry[1] = x
+        entry[2] = y
+        if n != c:
+            del cells[c][entity]
+            cells[n][entity] = entry
+            self.cells[entity] = (kind, n)
+
+    def cell_range(self, x0, y0, x1, y1):
+        a = self.cell(x0, y0)
+        b = self.cell(x1, y1)
+        for cy in range(a//self.columns, b//self.columns+1):
+            for cx in range(a%self.columns, b%self.columns+1):
+                yield cy*self.columns + cx
+
+    def query(self, kind, pos, radius):
+        # Entities whose xy distance to pos is below radius, in the
+        # order they were inserted.
+        if not kind in self.layers:
+            return []
+        x, y = pos[0], pos[1]
+        cells = self.layers[kind]
+        rr = radius*radius
+        hits = []
+        for c in self.cell_range(x-radius, y-radius, x+radius, y+radius):
+            self.tested += len(cells[c])
+            for entity, (order, ex, ey) in cells[c].items():
+                dx = ex-x
+                dy = ey-y
+                if dx*dx+dy*dy < rr:
+                    hits.append((order, entity))
+        hits.sort(key=lambda hit: hit[0])
+        return [entity for order, entity in hits]
+
+    def query_rect(self, kind, x0, y0, x1, y1):
+        # Entities strictly inside the rectangle, in insertion order.
+        if not kind in self.layers:
+            return []
+        cells = self.layers[kind]
+        hits = []
+        for c in self.cell_range(x0, y0, x1, y1):
+            self.tested += len(cells[c])
+            for entity, (order, ex, ey) in cells[c].items():
+                if x0 < ex < x1 and y0 < ey < y1:
+                    hits.append((order, entity))
+        hits.sort(key=lambda hit: hit[0])
+        return [entity for order, entity in hits]
@@ -0,0 +1,19 @@
+from collections import defaultdict
+
+
+class ScriptedInput():
+    # Stands in for base.device_listener when there are no devices.
+    # script(tick) returns ((x, y), spawn) for the game context, nothing
+    # is ever pressed in other contexts.
+    def __init__(self, script=None):
+        self.script = script
+
+    def read_context(self, context):
+        if context != "game":
+            return defaultdict(bool)
+        tick = base.clock.tick
+        if self.script:
+            movement, spawn = self.script(tick)
+        else:
+            movement, spawn = (0, 0), True
+        return {"movement": movement, "spawn": spawn}
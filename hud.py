@@ -0,0 +1,65 @@
+from panda3d.core import NodePath, TextNode
+
+
+FLICKER = ((0,1,1,1), (0,1,0,1), (0,0,1,1))
+
+
+def popup_scale(value):
+    # Same sizes the old fixed score strings had: 10 is smallest, every
+    # 50 of combo grows a bit, 1000 and up is the jackpot.
+    if value >= 1000:
+        return 3.0
+    return 0.5+(value//50)/10
+
+
+class DigitAtlas():
+    # Generates the ten digit glyphs once, then lays out any number from
+    # instances of them. Laid out numbers are cached by value.
+    def __init__(self, font):
+        self.glyphs = {}
+        self.advance = {}
+        text = TextNode("digit")
+        text.font = font
+        for digit in "0123456789":
+            text.text = digit
+            self.glyphs[digit] = NodePath(text.generate())
+            self.advance[digit] = text.calc_width(digit)
+        self.numbers = {}
+
+    def number(self, value):
+        if not value in self.numbers:
+            string = str(value)
+            node = NodePath(string)
+            x = -sum(self.advance[digit] for digit in string)/2
+            for digit in string:
+                glyph = self.glyphs[digit].instance_under_node(node, digit)
+                glyph.set_x(x)
+                x += self.advance[digit]
+            node.set_scale(popup_scale(value))
+            node.flatten_strong()
+            self.numbers[value] = node
+        return self.numbers[value]
+
+
+class Hud():
+    # Score, lives and highscore text, only regenerated when one of them
+    # changes. Score popups all hang under one node that carries the
+    # shared flicker.
+    def __init__(self, font):
+        self.info = TextNode("info")
+        self.info.font = font
+        self.node = render2d.attach_new_node(self.info)
+        self.node.set_scale(0.02)
+        self.node.set_pos(-0.95,0,0.9)
+        self.node.hide()
+        self.shown = None
+        self.digits = DigitAtlas(font)
+        self.popups = render.attach_new_node("popups")
+        self.flicker = 0
+
+    def update(self, highscore, score, lives):
+        if self.shown != (highscore, score, lives):
+            self.shown = highscore, score, lives
+            self.info.text = "HIGHSCORE:{}\n\nSCORE:{}\n\nLIVES:{}".format(highscore, score, lives)
+        self.flicker = (self.flicker+1)%len(FLICKER)
+        self.popups.set_color_scale(FLICKER[self.flicker])
@@ -1,4 +1,9 @@
+import numpy
+
 from panda3d.core import NodePath, SequenceNode, LineSegs
+from panda3d.core import GeomNode, Geom, GeomLines, GeomVertexData
+from panda3d.core import GeomVertexFormat, GeomVertexArrayFormat, InternalName
+from panda3d.core import RenderState, RenderModeAttrib, OmniBoundingVolume
 
 def draw_lines(base):
     linesegs = LineSegs("lines")
@@ -42,3 +47,65 @@ def draw_lines(base):
     sequence.set_frame_rate(60)
     base.models["lines"]["cross"].attach_new_node(sequence)
     base.linesegs = linesegs
+
+
+class LineBuffer():
+    # One persistent node for lines that only live for a frame. Lines are
+    # collected with add() and written into a single vertex buffer by
+    # update(), grouped by thickness so every thickness is one Geom
+    # drawing a consecutive range of that buffer.
+    def __init__(self, parent, thicknesses=(3,4,5), capacity=64):
+        array = GeomVertexArrayFormat()
+        array.add_column(InternalName.get_vertex(), 3, Geom.NT_float32, Geom.C_point)
+        array.add_column(InternalName.get_color(), 4, Geom.NT_float32, Geom.C_color)
+        fmt = GeomVertexFormat.register_format(GeomVertexFormat(array))
+        self.vdata = GeomVertexData("lines", fmt, Geom.UH_dynamic)
+        self.buffer = numpy.zeros((capacity*2, 7), numpy.float32)
+        self.thicknesses = thicknesses
+        self.lines = {thickness: [] for thickness in thicknesses}
+        self.prims = {}
+        geom_node = GeomNode("lines")
+        for thickness in thicknesses:
+            prim = GeomLines(Geom.UH_dynamic)
+            geom = Geom(self.vdata)
+            geom.add_primitive(prim)
+            geom.set_bounds(OmniBoundingVolume())
+            geom_node.add_geom(geom, RenderState.make(
+                RenderModeAttrib.make(RenderModeAttrib.M_unchanged, thickness)))
+            self.prims[thickness] = prim
+        geom_node.set_bounds(OmniBoundingVolume())
+        geom_node.set_final(True)
+        self.node = parent.attach_new_node(geom_node)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, a, b, color, thickness):
+        self.lines[thickness].append((a, b, color))
+        self.count += 1
+
+    def clear(self):
+        for lines in self.lines.values():
+            lines.clear()
+        self.count = 0
+
+    def update(self):
+        if self.count*2 > len(self.buffer):
+            self.buffer = numpy.zeros((self.count*4, 7), numpy.float32)
+        buffer = self.buffer
+        row = 0
+        for thickness in self.thicknesses:
+            start = row
+            for a, b, color in self.lines[thickness]:
+                buffer[row, :3] = a
+                buffer[row, 3:] = color
+                buffer[row+1, :3] = b
+                buffer[row+1, 3:] = color
+                row += 2
+            prim = self.prims[thickness]
+            prim.clear_vertices()
+            if row > start:
+                prim.add_consecutive_vertices(start, row-start)
+                prim.close_primitive()
+        self.vdata.modify_array_handle(0).copy_data_from(buffer[:max(row, 1)])
@@ -0,0 +1,88 @@
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+
+from panda3d.core import Filename, NodePath, TextNode, AudioManager
+from panda3d.core import VirtualFileSystem, get_model_path
+
+
+class AssetLoader():
+    # Models go through Panda's own async loader thread, sounds and fonts
+    # through a small thread pool. Everything is stored under a name the
+    # game picks, get() only blocks if that one asset isn't in yet.
+    def __init__(self, workers=4):
+        self.threads = ThreadPoolExecutor(workers, thread_name_prefix="assets")
+        self.requests = {}
+        self.models = set()
+        self.paths = {}
+        self.times = {}
+
+    def model(self, name, path):
+        request = loader.loader.make_async_request(Filename(path))
+        loader.loader.load_async(request)
+        self.requests[name] = request
+        self.models.add(name)
+        self.paths[name] = path
+
+    def sound(self, name, path, mode=AudioManager.SM_heuristic, manager=None):
+        manager = manager or base.sfxManagerList[0]
+        self.run(name, manager.get_sound, Filename(path), False, mode)
+
+    def font(self, name, path):
+        self.run(name, loader.load_font, path)
+
+    def run(self, name, function, *args):
+        # Timed on the worker thread, so times holds the load itself
+        # and not the wait in the queue.
+        def timed():
+            start = perf_counter()
+            result = function(*args)
+            self.times[name] = perf_counter()-start
+            return result
+        self.requests[name] = self.threads.submit(timed)
+
+    def preload(self, name, path):
+        # For assets that might not exist, like the background after the
+        # last one.
+        if name in self.requests:
+            return True
+        filename = Filename(path)
+        if VirtualFileSystem.get_global_ptr().resolve_filename(filename, get_model_path().get_value()):
+            self.model(name, path)
+            return True
+        return False
+
+    def get(self, name):
+        result = self.requests[name].result()
+        if name in self.models and result is not None:
+            return NodePath(result)
+        return result
+
+    def progress(self):
+        done = sum(1 for request in self.requests.values() if request.done())
+        return done, len(self.requests)
+
+    def ready(self, *names):
+        return all(self.requests[name].done() for name in names)
+
+    def done(self):
+        done, total = self.progress()
+        return done == total
+
+    def wait(self):
+        for request in list(self.requests.values()):
+            request.result()
+
+
+class LoadingScreen():
+    def __init__(self):
+        self.text = TextNode("loading")
+        self.text.align = TextNode.A_center
+        self.text.set_text_color((1,0,1,1))
+        self.node = aspect2d.attach_new_node(self.text)
+        self.node.set_scale(0.07)
+
+    def update(self, done, total):
+        self.text.text = "LOADING\n\n{}/{}".format(done, total)
+
+    def destroy(self):
+        self.node.remove_node()
@@ -1,48 +1,137 @@
+# First, so the startup trace covers the imports below.
+from startup import STARTUP
+
 import sys
 import math
-from random import randint
+from time import perf_counter
 from collections import defaultdict
 
 from direct.showbase.ShowBase import ShowBase
 import panda3d
 import pman.shim
 
-from keybindings.device_listener import add_device_listener
-from keybindings.device_listener import SinglePlayerAssigner
-
+from panda3d.core import NodePath
 from panda3d.core import TextNode
-from panda3d.core import WindowProperties
-
-from sounds import load_sounds
-from lines import *
-from objects import *
+from panda3d.core import ClockObject
+from panda3d.core import ConfigVariableBool
+from panda3d.core import ConfigVariableInt
+from panda3d.core import ConfigVariableDouble
+from panda3d.core import ConfigVariableString
+from panda3d.core import AudioManager
+from direct.actor.Actor import Actor
 
+import rng
+from rng import randint, choice, uniform
+from headless import ScriptedInput
+from sounds import request_sounds, load_sounds
+from loading import AssetLoader, LoadingScreen
+from display import load_display_mode, pick_display_mode
+from grid import SpatialGrid
+from clock import SimClock, Interpolator
+from systems import Scheduler
+from pools import Pool, pool_report
+from registry import Registry
+from store import Store, entity_report
+from profiler import FrameProfiler
+from hud import Hud
+from lines import LineBuffer, draw_lines
+from objects import Player, Chaser, Swarm, Bullet, Mine, Explosion, Score
+from objects import make_centipede, raise_scores, fade_explosions, update_mines, move_bullets
 
+STARTUP.mark("imports")
 panda3d.core.load_prc_file(
     panda3d.core.Filename.expand_from('$MAIN_DIR/settings.prc')
 )
 
 
+# How make_enemies scales with the level, the balance runner varies
+# these: a value plus a step per level, chasers capped at chaser_max.
+# Past level 1 every level brings chasers_step more spiders.
+DIFFICULTY = {
+    "segment_time": 0.1,
+    "segment_time_step": 0.005,
+    "length": 4,
+    "length_step": 2,
+    "chaser_speed": 1,
+    "chaser_max": 6,
+    "chasers": 1,
+    "chasers_step": 0,
+}
+
+# What a tick runs, in this order: name, whether only the looks depend
+# on it, and its budget in ms. Cosmetic systems run at the cosmetic
+# rate and slow down further under load, gridfly-rate-<name> sets any
+# system's rate.
+SYSTEMS = (
+    ("announcement", True, 0.05),
+    ("player", False, 0.5),
+    ("background", True, 0.05),
+    ("explosions", True, 0.5),
+    ("bullets", False, 1.0),
+    ("mines", False, 0.5),
+    ("chasers", False, 0.5),
+    ("flowers", False, 0.2),
+    ("scores", True, 0.5),
+    ("segments", False, 1.0),
+    ("rules", False, 0.5),
+    ("hud", True, 0.2),
+)
+
+
 class GameApp(ShowBase):
-    def __init__(self):
+    def __init__(self, headless=False, seed=None, input_source=None, tick_rate=60, replay=None, sim_process=False, lockstep=None, telemetry=None, startup_trace=False):
+        self.headless = headless
+        self.startup_trace = startup_trace
+        # Plays the game in lockstep with a second player over UDP.
+        self.lockstep = lockstep
+        self.telemetry_path = telemetry
+        self.telemetry = None
+        if headless:
+            panda3d.core.load_prc_file_data("headless",
+                "window-type none\naudio-library-name null\n")
+        # The window opens at the size picked on an earlier run, if any.
+        picked = headless or load_display_mode()
         ShowBase.__init__(self)
         pman.shim.init(self)
-        info = self.pipe.getDisplayInformation()
-        for idx in range(info.getTotalDisplayModes()):
-            width = info.getDisplayModeWidth(idx)
-            height = info.getDisplayModeHeight(idx)
-            bits = info.getDisplayModeBitsPerPixel(idx)
-        wp = WindowProperties()
-        wp.set_size(width, height)
-        base.win.requestProperties(wp)
-        base.win.set_clear_color((0,0,0,1))
+        STARTUP.mark("showbase")
+        rng.seed(seed)
+        if headless:
+            # Fixed dt, and frames run back to back as fast as possible.
+            globalClock.set_mode(ClockObject.M_non_real_time)
+            globalClock.set_frame_rate(tick_rate)
+            # Without a window there is no camera, the rig still wants one.
+            self.cam = NodePath("cam")
+        else:
+            if not picked:
+                pick_display_mode(self.win, self.pipe)
+            base.win.set_clear_color((0,0,0,1))
         self.accept('escape', sys.exit)
-        add_device_listener(
-            config_file=panda3d.core.Filename.expand_from('$MAIN_DIR/keybindings.toml'),
-            assigner=SinglePlayerAssigner(),
-        )
+        if input_source is None and not headless:
+            from keybindings.device_listener import add_device_listener
+            from keybindings.device_listener import SinglePlayerAssigner
+            add_device_listener(
+                config_file=panda3d.core.Filename.expand_from('$MAIN_DIR/keybindings.toml'),
+                assigner=SinglePlayerAssigner(),
+            )
+            input_source = self.device_listener
+        self.input = input_source or ScriptedInput()
+        STARTUP.mark("display, input")
+        # A Recorder or Replay sits between the game and the real input.
+        self.replay = replay
+        # Where to seek the replay to once the game is made.
+        self.pending_seek = None
+        self.loaded = False
+        if replay:
+            replay.source = self.input
+            self.input = replay
 
+        self.clock = SimClock(tick_rate)
+        # Headless there is nothing to draw between ticks.
+        self.interpolate = not headless
+        self.interpolator = Interpolator()
         self.map_size = [25,50]
+        self.grid = SpatialGrid(self.map_size)
+        self.difficulty = dict(DIFFICULTY)
         self.segment_time = [0, 0.06]
         self.flower_time = [0, 4]
         self.extra_life = 0
@@ -52,21 +141,87 @@ class GameApp(ShowBase):
         base.cam.set_p(-50)
         base.cam.reparent_to(self.camera)
         self.camera.reparent_to(render)
-        self.sounds = load_sounds()
-        self.music = loader.load_sfx("music/song1.ogg")
+        self.entities = Registry()
+        self.segments = self.entities.kind("segments")
+        self.centipedes = self.entities.kind("centipedes")
+        self.chasers = self.entities.kind("chasers")
+        self.swarm = Swarm()
+        self.flowers = self.entities.kind("flowers")
+        self.bullets = self.entities.kind("bullets")
+        self.mines = self.entities.kind("mines")
+        self.explosions = self.entities.kind("explosions")
+        self.zaplines = LineBuffer(render)
+        self.scores = self.entities.kind("scores")
+        self.stores = {
+            "bullets": Store(Bullet.FIELDS),
+            "mines": Store(Mine.FIELDS),
+            "explosions": Store(Explosion.FIELDS),
+            "scores": Store(Score.FIELDS),
+        }
+        self.startup = {}
+        # The worker loads its own assets while this process loads these.
+        self.sim = None
+        if sim_process:
+            from simproc import SimProcess
+            self.sim = SimProcess(seed, tick_rate)
+        self.assets = AssetLoader()
+        self.request_assets()
+        STARTUP.mark("setup")
+        if headless:
+            self.assets.wait()
+            self.make_title()
+            self.make_game()
+        else:
+            self.loading = LoadingScreen()
+            self.loading.update(*self.assets.progress())
+            self.graphics_engine.render_frame()
+            self.graphics_engine.render_frame()
+            self.startup["first frame"] = STARTUP.mark("first frame")
+            self.title = False
+            self.task_mgr.add(self.wait_for_assets)
+
+    def request_assets(self):
+        # What the title screen needs goes first, it shows while the
+        # rest loads.
+        for name in ("bg_0", "textimation"):
+            self.assets.model(name, "models/{}.bam".format(name))
+        self.assets.font("dot", "fonts/dotrice.otf")
+        self.assets.font("pixel", "fonts/pressstart2p.ttf")
+        self.assets.sound("music", "music/song1.ogg", AudioManager.SM_stream, self.musicManager)
+        request_sounds(self.assets)
+        for model in ("enemies", "misc", "spider", "butterfly"):
+            self.assets.model(model, "models/{}.bam".format(model))
+
+    def wait_for_assets(self, task):
+        self.loading.update(*self.assets.progress())
+        if not self.title:
+            if not self.assets.ready("bg_0", "textimation", "dot", "pixel", "music"):
+                return task.cont
+            self.make_title()
+            self.title = True
+            self.loading.node.set_z(-0.8)
+        if not self.assets.done() or (self.sim and not self.sim.ready()):
+            return task.cont
+        self.loading.destroy()
+        self.make_game()
+        return task.done
+
+    def make_title(self):
+        # Nothing gets drawn headless, so there is nothing to bake either.
+        self.bake = (not self.headless and
+            ConfigVariableBool("gridfly-bake-animations", False).get_value())
+        self.baked = {}
+        self.music = self.assets.get("music")
         self.music.set_loop(True)
         self.music.play()
-        self.load_models()
         self.bg = self.bg_model = None
         self.make_background()
 
         self.fonts = {}
-        self.fonts["dot"] = loader.loadFont("fonts/dotrice.otf")
-        self.fonts["pixel"] = loader.loadFont("fonts/pressstart2p.ttf")
+        self.fonts["dot"] = self.assets.get("dot")
+        self.fonts["pixel"] = self.assets.get("pixel")
 
         ## FLOATING TEXT GARBAGE
-        self.textimation = Actor("models/textimation.bam")
-        self.textimation.loop("animation")
         self.announcement = TextNode("announcement")
         self.announcement.font = self.fonts["dot"]
         self.announcement.text = ">>GRIDFLY<<\n\nPRESS SPACE TO START\n\n\nMADE BY HENDRIK-JAN\n\nFOR PYWEEK29\n\nPANDA3D FOR THE WIN"
@@ -74,104 +229,147 @@ class GameApp(ShowBase):
         self.announcement.set_text_color((1,0,1,1))
         self.a_root = render.attach_new_node("announcement")
         self.a_node = NodePath("announcement")
-        self.announcement_node = self.a_node.attach_new_node(self.announcement)
+        self.announcement_node = NodePath(self.announcement)
         self.announcement_node.set_scale(5)
         self.announcement_node.set_p(-130)
         for i in range(2):
             n = self.a_root.attach_new_node(str("t"+str(i)))
             self.a_node.instance_to(n)
             n.set_z(i)
-        self.textimation.expose_joint(self.a_node, jointName="text", partName="modelRoot")
+        if self.bake:
+            # The text sits in every baked frame of the joint instead.
+            from bake import baked
+            self.textimation = baked(self.assets, "textimation", "animation", joint="text")
+            self.textimation.reparent_to(self.a_node)
+            for frame in self.textimation.get_children():
+                self.announcement_node.instance_to(frame)
+        else:
+            self.textimation = Actor(self.assets.get("textimation"))
+            self.textimation.loop("animation")
+            self.announcement_node.reparent_to(self.a_node)
+            self.textimation.expose_joint(self.a_node, jointName="text", partName="modelRoot")
         self.a_root.reparent_to(self.camera)
         self.a_root.set_pos((0,70,-50))
         self.a_root.set_transparency(True)
         self.a_root.set_alpha_scale(0.5)
         self.text_timer = 0
+        self.announced = 0
         ## END FLOATING TEXT GARBAGE
+        self.startup["title"] = STARTUP.mark("title")
 
+    def make_game(self):
+        self.sounds = load_sounds(self.assets,
+            ConfigVariableInt("gridfly-announcer-cache-kb", 512).get_value()*1024)
+        self.load_models()
+        # Nothing gets drawn headless, so there is nothing to batch either.
+        self.batch_render = (not self.headless and not self.sim and
+            ConfigVariableBool("gridfly-batch-render", False).get_value())
+        if self.batch_render:
+            # Bullets and segments keep their transforms on nodes outside
+            # the scene graph, the batcher draws them.
+            from batch import Batcher
+            self.batch_root = NodePath("batched")
+            self.batcher = Batcher(render)
+        else:
+            self.batch_root = render
         self.highscore = 0
         self.score = 0
         self.lives = 0
-        self.infotext = TextNode("info")
-        self.infotext.font = self.fonts["pixel"]
-        self.infotext.text = "HIGHSCORE:{}\n\nSCORE:{}\n\nLIVES:{}".format(self.highscore, self.score, self.lives)
-        self.infotext_node = render2d.attach_new_node(self.infotext)
-        self.infotext_node.set_scale(0.02)
-        self.infotext_node.set_pos(-0.95,0,0.9)
-        self.infotext_node.hide()
-
-        self.numbers = {}
-        numbers = ["10"]
-        for i in range(1, 25):
-            numbers.append(str((i)*50))
-        numbers.append("1000")
-        for n, number in enumerate(numbers):
-            self.numbers[number] = NodePath(number), TextNode(number)
-            self.numbers[number][1].text = number
-            self.numbers[number][1].align = 2
-            self.numbers[number][1].font = self.fonts["pixel"]
-            self.numbers[number][1].set_text_color((0,1,1,1))
-            self.numbers[number][0].attach_new_node(self.numbers[number][1])
-            self.numbers[number][0].set_scale(0.5+(n/10))
+        self.level = 1
+        self.wave = 1
+        self.hud = Hud(self.fonts["pixel"])
         self.first = True
-        self.segments = []
-        self.chasers = []
-        self.flowers = []
-        self.bullets = []
-        self.mines = []
-        self.explosions = []
-        self.zaplines = []
-        self.scores = []
+        self.make_pools()
+        self.profiler = FrameProfiler()
+        self.make_systems(self.clock.rate)
         self.player = Player()
-        self.task_mgr.add(self.update_objects)
+        self.players = [self.player]
+        if self.lockstep:
+            self.players.append(Player(1))
+        self.local_player = self.players[self.lockstep.local if self.lockstep else 0]
+        if self.telemetry_path:
+            from telemetry import Telemetry
+            self.telemetry = Telemetry(self, self.telemetry_path)
+        if self.sim:
+            from simproc import Mirror
+            self.mirror = Mirror(self)
+            self.task_mgr.add(self.update_view)
+        else:
+            self.task_mgr.add(self.update_objects)
+        self.startup["assets ready"] = STARTUP.mark("game")
+        if self.startup_trace:
+            print(STARTUP.report())
+        self.loaded = True
+        if self.pending_seek is not None:
+            self.seek(self.pending_seek)
+
+    def seek(self, tick):
+        # Windowed the game is only made once the assets are in, until
+        # then the seek waits for make_game.
+        if not self.loaded:
+            self.pending_seek = tick
+            return
+        self.pending_seek = None
+        self.replay.seek(self, tick)
 
     def destroy(self):
-        while len(self.segments) > 0: self.segments[0].destroy()
-        while len(self.chasers) > 0: self.chasers[0].destroy()
-        while len(self.flowers) > 0: self.flowers[0].destroy()
-        while len(self.bullets) > 0: self.bullets[0].destroy()
-        while len(self.mines) > 0: self.mines[0].destroy()
-        while len(self.explosions) > 0: self.explosions[0].destroy()
-        while len(self.zaplines) > 0: self.zaplines[0].destroy()
+        self.entities.clear()
+        self.grid.clear()
+        self.zaplines.clear()
+        self.zaplines.update()
 
-    def start(self, spawn=False):
+    def show_game(self):
         if self.first:
             draw_lines(self)
             self.first = False
         self.a_root.set_pos((0,50,-50))
         self.announcement_node.set_scale(6)
+        self.hud.node.show()
+
+    def start(self, spawn=False):
+        self.show_game()
         self.flower_time[0] = 0
         self.destroy()
         if not spawn:
             base.music.set_volume(1)
             self.announce("starting_game", "LEVEL 1 \n\n WAVE 1")
             self.extra_life = 0
-            self.player.highscore = False
             self.level = 1
             self.wave = 1
             self.lives = 3
             self.score = 0
-        self.infotext_node.show()
-        self.player.spawn((0,20,0))
+        for player in self.players:
+            if not spawn:
+                player.highscore = False
+            player.spawn((player.number*4-(len(self.players)-1)*2, 20, 0))
         self.chasers.append(Chaser(self.models["chasers"]["spider"], (0,60,0)))
         self.make_enemies()
 
     def zapline(self, a, b):
         color = choice(((1,0,1,1), (1,0,0,1), (0,1,0,1), (0,1,1,1), (0,0,1,1)))
-        base.linesegs.set_thickness(randint(3,5))
-        base.linesegs.set_color(color)
-        base.linesegs.move_to(a.get_pos())
-        base.linesegs.draw_to(b.get_pos())
-        line = render.attach_new_node(base.linesegs.create())
-        base.zaplines.append(line)
+        self.zaplines.add(a.get_pos(), b.get_pos(), color, randint(3,5))
+
+    def make_pools(self):
+        # Mine needs the cross from draw_lines, its pool only fills up
+        # once the first game has started.
+        self.pools = {}
+        self.pools["bullet"] = Pool(Bullet)
+        self.pools["mine"] = Pool(Mine)
+        for name in ("explosion_a", "explosion_b"):
+            self.pools[name] = Pool(Explosion, self.models["misc"][name])
+        self.pools["score"] = Pool(Score)
+        self.pools["bullet"].warm(64)
+        self.pools["explosion_a"].warm(32)
 
     def make_background(self, n=0):
         if self.bg_model:
             self.bg_model.remove_node()
         if self.bg:
             self.bg.remove_node()
-        self.bg_model = Actor("models/bg_"+str(n)+".bam")
-        self.bg_model.loop("animation")
+        name = "bg_"+str(n)
+        if not name in self.assets.requests:
+            self.assets.model(name, "models/"+name+".bam")
+        self.bg_model = self.animated(name, "animation")
         self.bg = NodePath("bg")
         for i in range(3):
             bg = self.bg.attach_new_node("bg-"+str(i))
@@ -181,130 +379,414 @@ class GameApp(ShowBase):
         self.bg.set_transparency(True)
         self.bg.set_alpha_scale(0.1)
         self.bg.reparent_to(render)
+        # Start on the next one now so switching doesn't stall a frame.
+        self.assets.preload("bg_"+str(n+1), "models/bg_"+str(n+1)+".bam")
 
     def load_models(self):
         models = ["enemies", "misc"]
         self.models = {}
         for model in models:
             self.models[model] = {}
-            for child in loader.loadModel("models/{}.bam".format(model)).get_children():
+            for child in self.assets.get(model).get_children():
                 for child_child in child.get_children():
                     child_child.set_pos(child, (0,0,0))
                 child.set_pos((0,0,0))
                 child.detach_node()
                 self.models[model][child.name] = child
+        self.role_models = {}
         self.models["chasers"] = {}
-        self.models["chasers"]["spider"] = Actor("models/spider.bam")
-        self.models["chasers"]["spider"].loop("walk")
-        self.models["chasers"]["spider"].set_play_rate(2, "walk")
+        self.models["chasers"]["spider"] = self.animated("spider", "walk", 2)
+
+    def animated(self, name, anim, rate=1):
+        # A model looping anim: an Actor, or with gridfly-bake-animations
+        # an instance of its baked loop, which all instances share.
+        if not self.bake:
+            actor = Actor(self.assets.get(name))
+            actor.loop(anim)
+            actor.set_play_rate(rate, anim)
+            return actor
+        # The rate is the sequence's own, one per rate it is played at.
+        if (name, anim, rate) not in self.baked:
+            from bake import baked
+            self.baked[name, anim, rate] = baked(self.assets, name, anim, rate=rate)
+        node = NodePath(name)
+        self.baked[name, anim, rate].instance_to(node)
+        return node
+
+    def restart_text(self):
+        # Every announcement starts the text's animation over.
+        if self.bake:
+            self.textimation.node().loop(True)
+        else:
+            self.textimation.loop("animation")
 
     def make_enemies(self):
         #self.segment_time = [0, 0.06]
-        self.segment_time = [0, 0.1-(0.005*self.level)]
-        self.chasers[0].speed = self.level
-        if self.chasers[0].speed > 6:
-            self.chasers[0].speed = 6
+        difficulty = self.difficulty
+        self.segment_time = [0, difficulty["segment_time"]-(difficulty["segment_time_step"]*self.level)]
+        chasers = difficulty["chasers"]+(self.level-1)*difficulty["chasers_step"]
+        while len(self.chasers) < chasers:
+            x = uniform(-self.map_size[0], self.map_size[0])
+            self.chasers.append(Chaser(self.models["chasers"]["spider"], (x,60,0)))
+        self.swarm.set_speed(min(difficulty["chaser_speed"]*self.level, difficulty["chaser_max"]))
 
         amount = self.wave+1
-        self.player.max_combo = 4+(self.level*2)
+        for player in self.players:
+            player.max_combo = 4+(self.level*2)
         gap = (self.map_size[0]*2)/amount
         for i in range(amount):
-            self.segments.append(EnemySegment(
+            make_centipede(
                 self.models["enemies"]["cent"+str(((self.level-1)%7)+1)],
-                length=4+(self.level*2), x=-self.map_size[0]+((gap/2)+gap*i)))
+                length=difficulty["length"]+(self.level*difficulty["length_step"]),
+                x=-self.map_size[0]+((gap/2)+gap*i))
 
     def update_objects(self, task):
         dt = globalClock.get_dt()
-        if self.text_timer > 0 and self.player.alive:
+        ticks = self.clock.advance(dt)
+        if self.lockstep:
+            # Ticks the peer's input is not in for yet run next frame.
+            allowed = self.lockstep.allow(self.clock.tick, ticks)
+            self.clock.hold(ticks-allowed)
+            ticks = allowed
+        if ticks:
+            self.zaplines.clear()
+            if self.interpolate:
+                self.interpolator.restore()
+        for i in range(ticks):
+            if self.interpolate and i == ticks-1:
+                self.interpolator.before_tick(self.movers())
+            self.tick()
+        if self.interpolate:
+            if ticks:
+                self.interpolator.after_tick(self.movers())
+            self.interpolator.blend(self.clock.alpha)
+        if self.lockstep:
+            self.lockstep.send()
+        self.present(dt)
+        return task.cont
+
+    def update_view(self, task):
+        # With the simulation in its own process: ask it for this
+        # frame's ticks and draw the last ones it finished.
+        dt = globalClock.get_dt()
+        profiler = self.profiler
+        ticks = self.clock.advance(dt)
+        self.sim.advance(ticks, self.input.read_context('game'))
+        self.clock.tick += ticks
+        profiler.start("mirror")
+        snapshot = self.sim.latest()
+        if snapshot:
+            self.zaplines.clear()
+            self.interpolator.restore()
+            self.interpolator.before_tick(self.mirror.movers())
+            self.mirror.apply(*snapshot)
+            self.interpolator.after_tick(self.mirror.movers())
+        self.mirror.play(self.sim.events())
+        self.interpolator.blend(self.clock.alpha)
+        profiler.stop("mirror")
+        self.present(dt)
+        return task.cont
+
+    def present(self, dt):
+        profiler = self.profiler
+        if self.batch_render:
+            profiler.start("batches")
+            self.update_batches()
+            profiler.stop("batches")
+        self.zaplines.update()
+        # camera
+        profiler.start("camera")
+        vector = self.local_player.node.getPos() - self.camera.getPos()
+        self.camera.set_pos(self.camera.get_pos()+(vector*(4*dt)))
+        profiler.stop("camera")
+        if self.sim:
+            # Otherwise the hud is one of the systems.
+            profiler.start("hud")
+            self.hud.update(self.highscore, self.score, self.lives)
+            profiler.stop("hud")
+        else:
+            self.scheduler.end_frame()
+        self.sounds.update()
+        if self.input.read_context('debug')["overlay"]:
+            profiler.toggle_overlay(self.fonts["pixel"])
+        profiler.end_frame(dt, self.entities)
+
+    def movers(self):
+        # What moves every tick and is worth interpolating. Segments
+        # step a whole unit at their own pace and are drawn as they are.
+        for player in self.players:
+            if player.alive:
+                yield player.node
+        for kind in (self.bullets, self.chasers, self.scores):
+            for entity in kind:
+                yield entity.node
+
+    def tick(self):
+        if self.replay:
+            self.replay.begin_tick(self)
+        if self.lockstep:
+            self.lockstep.begin_tick(self.clock.tick, self.input.read_context('game'))
+        if self.telemetry:
+            started = perf_counter()
+            self.scheduler.tick()
+            self.telemetry.log(perf_counter()-started)
+        else:
+            self.scheduler.tick()
+        self.clock.tick += 1
+
+    def make_systems(self, tick_rate):
+        cosmetic_rate = ConfigVariableInt("gridfly-cosmetic-rate", 30).get_value()
+        self.scheduler = Scheduler(self.clock, self.profiler,
+            ConfigVariableDouble("gridfly-sim-budget-ms", 8).get_value())
+        # Headless runs have to play out the same every time.
+        # Both sides of a lockstep game have to run the same systems.
+        self.scheduler.adaptive = not self.headless and not self.lockstep
+        for sort, (name, cosmetic, budget) in enumerate(SYSTEMS):
+            rate = ConfigVariableInt("gridfly-rate-"+name,
+                cosmetic_rate if cosmetic else tick_rate).get_value()
+            period = max(1, round(tick_rate/rate))
+            self.scheduler.add(name, getattr(self, "update_"+name), sort*10,
+                period, cosmetic, budget)
+
+    def update_announcement(self, dt):
+        if self.text_timer > 0 and self.playing():
             self.text_timer -= dt
             if self.text_timer < 0:
                 self.text_timer = 0
                 self.announcement.text = ""
 
-        for zapline in self.zaplines:
-            zapline.remove_node()
-            self.zaplines.remove(zapline)
-
-        if self.player.alive:
+    def update_player(self, dt):
+        if self.playing():
             self.flower_time[0] += dt
-            self.player.update()
-            if self.player.zapping > 0:
+        for player in self.players:
+            if player.alive:
+                player.update()
+
+    def update_background(self, dt):
+        if self.playing():
+            if any(player.zapping > 0 for player in self.players):
                 self.bg.set_alpha_scale(0.2)
             else:
                 self.bg.set_alpha_scale(0.06)
-        for explosion in self.explosions:
-            explosion.update()
+
+    def update_explosions(self, dt):
+        self.profiler.count("explosions", len(self.explosions))
+        fade_explosions(dt)
+
+    def update_bullets(self, dt):
+        self.profiler.count("bullets", len(self.bullets))
+        # They move as one, but hit or leave one at a time in list order.
+        gone = move_bullets(dt)
         for bullet in self.bullets:
-            bullet.update()
-        for mine in self.mines:
-            mine.update()
+            if bullet in gone:
+                bullet.destroy()
+            else:
+                bullet.collide()
+
+    def update_mines(self, dt):
+        self.profiler.count("mines", len(self.mines))
+        update_mines(dt, [(player, self.mines_crossing(player.node.get_pos()))
+            for player in self.players])
         if len(self.mines) == 0:
-            self.sounds["2d"]["lines"].stop()
-        for chaser in self.chasers:
-            chaser.update()
+            self.sounds.stop("2d/lines")
+
+    def update_chasers(self, dt):
+        self.profiler.count("chasers", len(self.chasers))
+        self.swarm.update()
+
+    def update_flowers(self, dt):
+        self.profiler.count("flowers", len(self.flowers))
         for flower in self.flowers:
             flower.update()
-        for score in self.scores:
-            score.update()
-        for number in self.numbers:
-            self.numbers[number][1].set_text_color(choice(((0,1,1,1),(0,1,0,1),(0,0,1,1))))
-        # segments
+
+    def update_scores(self, dt):
+        self.profiler.count("scores", len(self.scores))
+        raise_scores(dt)
+
+    def update_segments(self, dt):
         self.segment_time[0] += dt
         if self.segment_time[0] > self.segment_time[1]:
             self.segment_time[0] -= self.segment_time[1]
-            for s, segment in enumerate(self.segments):
-                try:
-                    segment.update()
-                except:
-                    pass
+            self.profiler.count("segments", len(self.segments))
+            for centipede in self.centipedes:
+                centipede.update()
+            for player in self.players:
+                if self.grid.query("segments", player.node.get_pos(), 0.8):
+                    player.die()
+        else:
+            self.profiler.count("segments", 0)
+
+    def update_rules(self, dt):
         # end wave
-        if len(self.segments) == 0 and base.player.alive:
+        if len(self.segments) == 0 and self.playing():
             self.wave += 1
             if self.wave > 4:
                 self.wave = 1
                 self.level += 1
-            self.player.zapping = -1
-            self.player.flowerpower = 0
+            for player in self.players:
+                player.zapping = -1
+                player.flowerpower = 0
             self.flower_time[0] = 0
             self.announce(choice(("give_it_to_me", "oh_baby", "sexy", "thats_the_stuff", "sure_why_not")),
                 "LEVEL " + str(self.level)+"\n\nWAVE " + str(self.wave))
             self.make_enemies()
-        # camera
-        vector = base.player.node.getPos() - self.camera.getPos()
-        self.camera.set_pos(self.camera.get_pos()+(vector*(4*dt)))
-        if not self.player.alive:
-            if self.device_listener.read_context('game')["spawn"]:
+        if not self.playing():
+            if any(self.game_input(player)["spawn"] for player in self.players):
                 if self.lives == 0:
                     self.start()
                 else:
                     self.start(True)
                     self.announcement.text = ""
-        self.infotext.text = "HIGHSCORE:{}\n\nSCORE:{}\n\nLIVES:{}".format(self.highscore, self.score, self.lives)
+        else:
+            # A butterfly that is down comes back while the other one
+            # plays on, as long as there are lives left.
+            for player in self.players:
+                if not player.alive and self.lives > 0 and self.game_input(player)["spawn"]:
+                    player.spawn((0,20,0))
+        self.entities.flush()
         if self.score > self.highscore:
             self.highscore = self.score
-            self.player.highscore = True
+            for player in self.players:
+                player.highscore = True
         if self.score > 25000*(self.extra_life+1):
             self.announcement.text = str(25000*(self.extra_life+1)) + str("POINTS!!!\n\nEXTRA LIFE!!!")
             self.extra_life += 1
             self.lives += 1
-            base.sounds["2d"]["extralife"].play()
+            base.sounds.play("2d/extralife")
             self.text_timer = 2
 
-        return task.cont
+    def update_hud(self, dt):
+        self.hud.update(self.highscore, self.score, self.lives)
+
+    def update_batches(self):
+        groups = {self.models["misc"]["bullet"]: [bullet.node for bullet in self.bullets]}
+        for segment in self.segments:
+            groups.setdefault(segment.models[segment.role], []).append(segment.node)
+        self.batcher.draw(groups)
+
+    def playing(self):
+        return any(player.alive for player in self.players)
+
+    def game_input(self, player):
+        # What a butterfly is told to do this tick.
+        if self.lockstep:
+            return self.lockstep.input(player.number)
+        return self.input.read_context('game')
+
+    def mines_crossing(self, pos, width=0.2):
+        x, y = pos[0], pos[1]
+        xsize, ysize = self.map_size
+        far = xsize+ysize
+        crossing = set(self.grid.query_rect("mines", x-width, -far, x+width, ysize+far))
+        crossing.update(self.grid.query_rect("mines", -xsize-far, y-width, xsize+far, y+width))
+        return crossing
 
     def announce(self, say, extra=""):
-        for sound in base.sounds["announce"]:
-            base.sounds["announce"][sound].stop()
-        base.sounds["announce"][say].play()
+        base.sounds.stop_group("announce")
+        base.sounds.play("announce/"+say)
         s = say.split("_")
         s = " ".join(s)
-        self.textimation.loop("animation")
+        self.restart_text()
+        self.announced += 1
         self.announcement.text = s.upper() + "!!!"+"\n\n"+extra
         self.text_timer = 2
 
+    def simulate(self, ticks):
+        for i in range(ticks):
+            self.task_mgr.step()
+
 def main():
-    app = GameApp()
-    app.run()
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--ticks", type=int, default=3600)
+    parser.add_argument("--pstats", action="store_true")
+    parser.add_argument("--audio-report", action="store_true")
+    parser.add_argument("--systems-report", action="store_true")
+    parser.add_argument("--entity-report", action="store_true")
+    parser.add_argument("--pool-report", action="store_true")
+    parser.add_argument("--record", help="write the session's input to this file")
+    parser.add_argument("--replay", help="play back a recorded session")
+    parser.add_argument("--seek", type=float, default=0, help="seconds into the replay to start at")
+    parser.add_argument("--sim-process", action="store_true", help="run the simulation in its own process")
+    parser.add_argument("--host", type=int, metavar="PORT", help="wait for a second player on this UDP port")
+    parser.add_argument("--join", metavar="HOST:PORT", help="join a game as the second player")
+    parser.add_argument("--net-report", action="store_true")
+    parser.add_argument("--startup-trace", action="store_true", help="print where startup time went")
+    parser.add_argument("--telemetry", metavar="PATH", help="write per tick telemetry to this file",
+        default=ConfigVariableString("gridfly-telemetry", "").get_value() or None)
+    args = parser.parse_args()
+    if args.sim_process and (args.headless or args.record or args.replay):
+        parser.error("--sim-process only works windowed, without --record or --replay")
+    if (args.host is not None or args.join) and (args.sim_process or args.record or args.replay):
+        parser.error("--host and --join don't work with --sim-process, --record or --replay")
+    if args.pstats:
+        panda3d.core.load_prc_file_data("pstats", "want-pstats 1\n")
+    seed = args.seed
+    tick_rate = 60
+    replay = None
+    if args.replay:
+        from replay import Replay
+        replay = Replay(args.replay)
+        seed = replay.seed
+        tick_rate = replay.tick_rate
+    elif args.record:
+        import random
+        from replay import Recorder
+        if seed is None:
+            seed = random.SystemRandom().randrange(2**62)
+        replay = Recorder(args.record, seed, tick_rate)
+    lockstep = None
+    if args.host is not None or args.join:
+        import random
+        import netplay
+        if args.host is not None:
+            if seed is None:
+                seed = random.SystemRandom().randrange(2**62)
+            print("waiting for a second player on port", args.host)
+            sock, peer = netplay.host(args.host, seed)
+            local = 0
+        else:
+            address, port = args.join.rsplit(":", 1)
+            sock, peer, seed = netplay.join((address, int(port)))
+            local = 1
+        lockstep = netplay.Lockstep(sock, peer, local,
+            ConfigVariableInt("gridfly-net-delay", 3).get_value(),
+            ConfigVariableInt("gridfly-net-check-every", 60).get_value(),
+            tick_rate=tick_rate)
+    app = GameApp(headless=args.headless, seed=seed, tick_rate=tick_rate, replay=replay,
+        sim_process=args.sim_process, lockstep=lockstep, startup_trace=args.startup_trace,
+        telemetry=args.telemetry and panda3d.core.Filename.expand_from(args.telemetry).to_os_specific())
+    if lockstep:
+        lockstep.checksum = lambda: netplay.checksum(app)
+    if args.replay:
+        app.seek(replay.index[0][0]+int(args.seek*tick_rate))
+    try:
+        if args.headless:
+            app.simulate(args.ticks)
+            print("level", app.level, "wave", app.wave, "score", app.score)
+        else:
+            app.run()
+    finally:
+        if replay:
+            replay.close()
+        if app.sim:
+            app.sim.close()
+        if lockstep:
+            lockstep.close()
+        if app.telemetry:
+            app.telemetry.close()
+        if args.audio_report:
+            print(app.sounds.report())
+        if args.systems_report:
+            print(app.scheduler.report())
+        if args.entity_report:
+            print(entity_report(app.entities))
+        if args.pool_report:
+            print(pool_report(app.pools))
+        if args.net_report and lockstep:
+            print(lockstep.report())
 
 if __name__ == '__main__':
     main()
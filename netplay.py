@@ -0,0 +1,283 @@
+import zlib
+import socket
+import struct
+from array import array
+from time import perf_counter
+
+from panda3d.core import PStatCollector
+from direct.directnotify.DirectNotifyGlobal import directNotify
+
+
+# Every packet is a header and then the sender's input frames that were
+# not acknowledged yet, starting at tick first. A frame is one byte of
+# flags: whether x and y changed since the frame before it, and spawn.
+# Only the axes that changed follow it, as signed bytes. The first frame
+# is relative to a neutral one, so a packet never depends on another.
+# stamp and echo are milliseconds, for the round trip time. With
+# HAS_CHECK set, the tick and checksum of the sender's state follow the
+# header.
+HEADER = struct.Struct("<IIBBHH")
+CHECK = struct.Struct("<II")
+HELLO = struct.Struct("<4sBq")
+MAGIC = b"GFNP"
+VERSION = 1
+X, Y, SPAWN = 1, 2, 4
+HAS_CHECK = 1
+NEUTRAL = (0, 0, False)
+# What UDP and IPv4 add to every packet, for the bandwidth.
+OVERHEAD = 28
+
+notify = directNotify.newCategory("netplay")
+
+
+def quantize(axis):
+    return max(-127, min(127, int(round(axis*127))))
+
+
+def encode(frames, previous=NEUTRAL):
+    data = bytearray()
+    for frame in frames:
+        x, y, spawn = frame
+        flags = SPAWN if spawn else 0
+        if x != previous[0]:
+            flags |= X
+        if y != previous[1]:
+            flags |= Y
+        data.append(flags)
+        if flags & X:
+            data += struct.pack("<b", x)
+        if flags & Y:
+            data += struct.pack("<b", y)
+        previous = frame
+    return bytes(data)
+
+
+def decode(data, offset, count, previous=NEUTRAL):
+    frames = []
+    x, y = previous[0], previous[1]
+    for i in range(count):
+        flags = data[offset]
+        offset += 1
+        if flags & X:
+            x, = struct.unpack_from("<b", data, offset)
+            offset += 1
+        if flags & Y:
+            y, = struct.unpack_from("<b", data, offset)
+            offset += 1
+        frames.append((x, y, bool(flags & SPAWN)))
+    return frames
+
+
+def checksum(app):
+    # What the game rules read, cheap enough to do every second.
+    # Explosions and popups are cosmetic and left out.
+    values = array("f")
+    for kind in (app.segments, app.mines, app.bullets, app.chasers, app.flowers):
+        for entity in kind:
+            values.extend(entity.node.get_pos())
+    for player in app.players:
+        values.extend(player.node.get_pos())
+    crc = zlib.crc32(values.tobytes())
+    return zlib.crc32(struct.pack("<qiii", app.score, app.lives, app.level, app.wave), crc)
+
+
+def milliseconds():
+    return int(perf_counter()*1000) & 0xffff
+
+
+class Lockstep():
+    # Both games run the same ticks on the same input. The local input
+    # of tick t is played at t+delay and sent right away, a tick only
+    # runs once the peer's input for it is in. Frames are resent until
+    # acknowledged, so a lost packet costs a stall, not a desync.
+    def __init__(self, sock, peer, local, delay=3, check_every=60, checksum=None, tick_rate=60):
+        self.socket = sock
+        self.socket.setblocking(False)
+        self.peer = peer
+        self.local = local
+        self.remote = 1-local
+        self.delay = delay
+        self.check_every = check_every
+        self.checksum = checksum
+        self.tick_rate = tick_rate
+        # The first ticks are played before anyone could have sent
+        # anything, both sides know they are neutral.
+        self.frames = ({}, {})
+        for tick in range(delay):
+            self.frames[0][tick] = self.frames[1][tick] = NEUTRAL
+        self.tick = 0
+        self.ticks = 0
+        self.sent = delay-1
+        self.acked = delay-1
+        self.received = delay-1
+        self.pruned = 0
+        self.last_send = (self.sent, self.received, 0)
+        self.check = None
+        self.checks = {}
+        self.remote_checks = {}
+        self.checked = 0
+        self.desync = None
+        self.echo = 0
+        self.rtt = 0
+        self.stalls = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.window = perf_counter()
+        self.window_bytes = 0
+        self.bandwidth = 0
+        self.bandwidth_level = PStatCollector("Net:Bandwidth")
+        self.latency_level = PStatCollector("Net:Latency")
+
+    def begin_tick(self, tick, context):
+        # Called before every tick with the local input.
+        self.tick = tick
+        self.ticks += 1
+        x, y = context["movement"]
+        frame = quantize(x), quantize(y), bool(context["spawn"])
+        self.frames[self.local][tick+self.delay] = frame
+        self.sent = tick+self.delay
+        if self.checksum and tick%self.check_every == 0:
+            self.checks[tick] = self.checksum()
+            self.check = tick, self.checks[tick]
+            self.compare()
+        # Forget frames that were played and, for ours, acknowledged.
+        self.frames[self.remote].pop(tick-1, None)
+        while self.pruned < min(tick, self.acked+1):
+            self.frames[self.local].pop(self.pruned, None)
+            self.pruned += 1
+
+    def input(self, number):
+        x, y, spawn = self.frames[number][self.tick]
+        return {"movement": (x/127, y/127), "spawn": spawn}
+
+    def allow(self, tick, ticks):
+        # How many of the next ticks can run: those the peer's input is
+        # in for. The local input of a tick is only made in begin_tick,
+        # but always delay ticks ahead.
+        self.receive()
+        allowed = max(0, min(ticks, self.received+1-tick))
+        if allowed < ticks:
+            self.stalls += 1
+        return allowed
+
+    def send(self, resend=0.1):
+        # Only when there is a new frame or ack to tell, or it is time
+        # to resend what was not acknowledged.
+        now = perf_counter()
+        sent, received, when = self.last_send
+        if self.sent == sent and self.received == received and not self.check and now-when < resend:
+            return
+        self.last_send = self.sent, self.received, now
+        first = self.acked+1
+        last = min(self.sent, first+254)
+        frames = [self.frames[self.local][tick] for tick in range(first, last+1)]
+        flags = HAS_CHECK if self.check else 0
+        packet = HEADER.pack(first, self.received, len(frames), flags, milliseconds(), self.echo)
+        if self.check:
+            packet += CHECK.pack(*self.check)
+            self.check = None
+        packet += encode(frames)
+        try:
+            self.socket.sendto(packet, self.peer)
+        except OSError:
+            return
+        self.bytes_sent += len(packet)+OVERHEAD
+        self.window_bytes += len(packet)+OVERHEAD
+        if now-self.window > 1:
+            self.bandwidth = self.window_bytes/(now-self.window)
+            self.window = now
+            self.window_bytes = 0
+        self.bandwidth_level.set_level(self.bandwidth/1024)
+        self.latency_level.set_level(self.latency())
+
+    def receive(self):
+        while True:
+            try:
+                packet, address = self.socket.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # A port the peer has not opened yet, on some systems.
+                continue
+            if address != self.peer or len(packet) < HEADER.size:
+                continue
+            self.bytes_received += len(packet)+OVERHEAD
+            first, ack, count, flags, stamp, echo = HEADER.unpack_from(packet)
+            offset = HEADER.size
+            self.echo = stamp
+            if echo:
+                self.rtt = (milliseconds()-echo) & 0xffff
+            if flags & HAS_CHECK:
+                tick, value = CHECK.unpack_from(packet, offset)
+                offset += CHECK.size
+                self.remote_checks[tick] = value
+                self.compare()
+            self.acked = max(self.acked, min(ack, self.sent))
+            frames = self.frames[self.remote]
+            if first-1 > self.received:
+                # Frames behind a gap only come with a packet that also
+                # has the gap, ours told the peer what is missing.
+                continue
+            for tick, frame in enumerate(decode(packet, offset, count), first):
+                if tick > self.received:
+                    frames[tick] = frame
+                    self.received = tick
+
+    def compare(self):
+        for tick in list(self.remote_checks):
+            if tick in self.checks:
+                if self.checks[tick] != self.remote_checks[tick] and self.desync is None:
+                    self.desync = tick
+                    notify.warning("desync at tick {}".format(tick))
+                self.checked += 1
+                del self.checks[tick]
+                del self.remote_checks[tick]
+
+    def latency(self):
+        # What lockstep adds to every input: the delay, in milliseconds.
+        # Stalls come on top when the round trip is longer than that.
+        return self.delay*1000/self.tick_rate
+
+    def report(self):
+        return "NET {:5.2f}KB/s {:.0f}B/TICK DELAY {:.0f}ms RTT {}ms STALLS {} {}".format(
+            self.bandwidth/1024, self.bytes_sent/max(1, self.ticks), self.latency(),
+            self.rtt, self.stalls,
+            "DESYNC AT {}".format(self.desync) if self.desync is not None else "IN SYNC")
+
+    def close(self):
+        self.socket.close()
+
+
+def host(port, seed, timeout=60):
+    # Waits for a guest and tells it the seed. The host plays the first
+    # butterfly.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("", port))
+    sock.settimeout(timeout)
+    while True:
+        data, peer = sock.recvfrom(HELLO.size)
+        if len(data) == HELLO.size and HELLO.unpack(data)[:2] == (MAGIC, VERSION):
+            break
+    # Answer a few times, a lost answer only makes the guest ask again.
+    for i in range(3):
+        sock.sendto(HELLO.pack(MAGIC, VERSION, seed), peer)
+    return sock, peer
+
+
+def join(address, timeout=60):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(0.25)
+    started = perf_counter()
+    while perf_counter()-started < timeout:
+        sock.sendto(HELLO.pack(MAGIC, VERSION, 0), address)
+        try:
+            data, peer = sock.recvfrom(HELLO.size)
+        except socket.timeout:
+            continue
+        if len(data) == HELLO.size:
+            magic, version, seed = HELLO.unpack(data)
+            if (magic, version) == (MAGIC, VERSION):
+                # The other answers are too short for game packets and
+                # get dropped.
+                return sock, peer, seed
+    raise TimeoutError("no gridfly host at {}:{}".format(*address))
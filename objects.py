@@ -1,9 +1,15 @@
 import sys
-from random import randint, choice, uniform
-from direct.actor.Actor import Actor
+from array import array
+
+import numpy
+
+from rng import randint, choice, uniform
 from panda3d.core import NodePath
 from panda3d.core import Vec3
 
+from registry import SLOTS
+from store import Store, Field
+
 
 def limit_node(node):
     xsize, ysize = base.map_size
@@ -18,314 +24,582 @@ def limit_node(node):
 
 
 class Score():
-    def __init__(self, pos, score):
-        base.score += int(score)
-        self.node = NodePath("score")
-        base.numbers[score][0].instance_to(self.node)
-        self.node.reparent_to(render)
+    __slots__ = SLOTS+("node", "score", "pool", "store", "slot")
+    FIELDS = (("z", "f4"),)
+    z = Field()
+
+    def __init__(self):
+        self.score = None
+        self.slot = None
+        self.node = base.hud.popups.attach_new_node("score")
+
+    def spawn(self, pos, score):
+        if score != self.score:
+            self.score = score
+            self.node.node().remove_all_children()
+            base.hud.digits.number(score).instance_to(self.node)
+        base.score += score
         self.node.set_pos(pos)
         base.scores.append(self)
-        self.time = 0
+        base.stores["scores"].add(self)
+        self.z = self.node.get_z()
 
     def destroy(self):
         base.scores.remove(self)
-        self.node.remove_node()
+        base.stores["scores"].remove(self)
+
+    def release(self):
+        base.stores["scores"].remove(self)
+        self.pool.put(self)
 
-    def update(self):
-        self.node.set_z(self.node.get_z()+(15*globalClock.get_dt()))
-        if self.node.get_z() > 10:
-            self.destroy()
+
+def raise_scores(dt):
+    store = base.stores["scores"]
+    if not len(store):
+        return
+    z = store["z"]
+    z += 15*dt
+    for score, value in zip(store.entities, z.tolist()):
+        score.node.set_z(value)
+    for score in store.select(z > 10):
+        score.destroy()
 
 
 class Flower():
+    __slots__ = SLOTS+("node", "time", "flowerpower")
+
     def __init__(self, pos):
         self.node = NodePath("flower")
         base.models["misc"]["flower"].instance_to(self.node)
         self.node.reparent_to(render)
         self.node.set_pos(pos)
         base.flowers.append(self)
-        base.announce(choice(("here_comes_flower", "little_flower")))
         self.time = 0
         self.flowerpower = 3
 
     def destroy(self):
         base.flowers.remove(self)
+
+    def release(self):
         self.node.remove_node()
 
     def update(self):
-        self.node.set_scale(self.node.get_scale()-globalClock.get_dt()/15)
+        dt = base.clock.dt
+        self.node.set_scale(self.node.get_scale()-dt/15)
         scale = self.node.get_scale().x
         if scale <= 0.1:
             self.destroy()
             return
-        for mine in base.mines:
-            vector = mine.node.getPos() - self.node.getPos()
+        for mine in base.grid.query("mines", self.node.get_pos(), 0.5):
+            mine.destroy()
+        self.node.set_h(self.node.get_h()+(60*dt))
+        for player in base.players:
+            vector = player.node.getPos() - self.node.getPos()
             distance = vector.get_xy().length()
-            if distance < 0.5:
-                mine.destroy()
-        self.node.set_h(self.node.get_h()+1)
-        vector = base.player.node.getPos() - self.node.getPos()
-        distance = vector.get_xy().length()
-        if distance < 1:
-            Score(self.node.get_pos(), "1000")
-            base.sounds["2d"]["zap_b"].play()
-            self.destroy()
-            base.announce(choice(("flower_power","butterzapper_recharge")))
-            base.player.flowerpower = self.flowerpower*scale
-            base.player.zapping = self.flowerpower*scale
+            if distance < 1:
+                base.pools["score"].get(self.node.get_pos(), 1000)
+                base.sounds.play("2d/zap_b")
+                self.destroy()
+                base.announce(choice(("flower_power","butterzapper_recharge")))
+                player.flowerpower = self.flowerpower*scale
+                player.zapping = self.flowerpower*scale
+                return
 
 
 class Explosion():
-    def __init__(self, geometry, pos, speed=1):
+    __slots__ = SLOTS+("node", "pool", "store", "slot")
+    FIELDS = (("time", "f8"), ("speed", "f8"), ("scale", "f4"))
+    time = Field()
+    speed = Field()
+    scale = Field()
+
+    def __init__(self, geometry):
+        self.slot = None
         self.node = NodePath("explosion")
         geometry.instance_to(self.node)
         self.node.reparent_to(render)
+        self.node.set_transparency(True)
+
+    def spawn(self, pos, speed=1):
         self.node.set_pos(pos)
         self.node.set_scale(0.01)
+        self.node.clear_color_scale()
         base.explosions.append(self)
-        self.time = 0
+        base.stores["explosions"].add(self)
         self.speed = speed
+        self.scale = 0.01
         if speed > 2:
-            e = "explosion_b"
-            base.sounds["2d"][e].set_play_rate(1)
+            base.sounds.play("2d/explosion_b")
         else:
-            e = "explosion_s"
-            base.sounds["2d"][e].set_play_rate(1/speed)
-
-        base.sounds["2d"][e].play()
+            base.sounds.play("2d/explosion_s", rate=1/speed)
 
     def destroy(self):
         base.explosions.remove(self)
-        self.node.remove_node()
+        base.stores["explosions"].remove(self)
 
-    def update(self):
-        self.time += globalClock.get_dt()
-        self.node.set_scale(self.node.get_scale()+((0.005/self.time)*self.speed))
-        self.node.set_transparency(True)
-        self.node.set_alpha_scale((0.5-self.time)*self.speed)
-        if self.time > (0.5*(self.speed)):
-            self.destroy()
+    def release(self):
+        base.stores["explosions"].remove(self)
+        self.pool.put(self)
+
+
+def fade_explosions(dt):
+    store = base.stores["explosions"]
+    if not len(store):
+        return
+    time, speed, scale = store["time"], store["speed"], store["scale"]
+    time += dt
+    scale += (0.3*dt/time)*speed
+    alpha = (0.5-time)*speed
+    for explosion, s, a in zip(store.entities, scale.tolist(), alpha.tolist()):
+        explosion.node.set_scale(s)
+        explosion.node.set_alpha_scale(a)
+    for explosion in store.select(time > 0.5*speed):
+        explosion.destroy()
 
 
 class Mine():
-    def __init__(self, pos):
-        self.time = 0
+    __slots__ = SLOTS+("node", "cross", "pool", "store", "slot")
+    # size is the scale of the cross, x and y where the mine lies.
+    FIELDS = (("time", "f8"), ("blown", "?"), ("size", "f4"), ("x", "f4"), ("y", "f4"))
+    time = Field()
+    blown = Field()
+    size = Field()
+
+    def __init__(self):
+        self.slot = None
         self.node = NodePath("mine")
-        self.cross = NodePath("cross")
         base.models["misc"]["egg"].instance_to(self.node)
+        self.cross = self.node.attach_new_node("cross")
+        base.models["lines"]["cross"].instance_to(self.cross)
         self.node.reparent_to(render)
-        self.cross.reparent_to(render)
+
+    def spawn(self, pos):
         self.node.set_pos(pos)
-        self.cross.set_pos(pos)
+        self.cross.set_scale(1)
+        self.cross.hide()
         base.mines.append(self)
-        self.blown = False
+        base.grid.insert("mines", self, pos)
+        store = base.stores["mines"]
+        store.add(self)
+        x, y, z = self.node.get_pos()
+        store.arrays["x"][self.slot] = x
+        store.arrays["y"][self.slot] = y
+        self.size = 1
 
     def destroy(self):
-        Explosion(base.models["misc"]["explosion_a"], self.node.get_pos())
+        base.pools["explosion_a"].get(self.node.get_pos())
         base.mines.remove(self)
-        self.node.remove_node()
-        self.cross.remove_node()
-
-    def update(self):
-        self.time += globalClock.get_dt()
-        if self.time > 1:
-            if not self.blown:
-                base.sounds["2d"]["lines"].set_loop(True)
-                base.sounds["2d"]["lines"].play()
-                self.blown = True
-                base.models["lines"]["cross"].instance_to(self.cross)
-            self.cross.set_scale(self.cross.get_scale()+0.2)
-            self.cross.set_color((0,1,0,1))
-            # Hittest with player
-            x, y, z = self.node.get_pos()
-            s = self.cross.get_scale()
-            px, py, pz = base.player.node.get_pos()
-            width = 0.2
-            if (x < px+width and x > px-width) or (y < py+width and y > py-width):
-                vector = base.player.node.getPos() - self.node.getPos()
-                distance = vector.get_xy().length()
-                if distance < s:
-                    base.player.die()
-        if self.time > 5:
-            self.destroy()
-            return
+        base.grid.remove(self)
+        base.stores["mines"].remove(self)
+
+    def release(self):
+        base.stores["mines"].remove(self)
+        self.pool.put(self)
+
+
+def update_mines(dt, crossings):
+    # Sizes and distances are float32 like the node transforms they
+    # replace, so the hittest comes out the same.
+    store = base.stores["mines"]
+    if not len(store):
+        return
+    time, blown, size = store["time"], store["blown"], store["size"]
+    time += dt
+    armed = time > 1
+    for i in numpy.flatnonzero(armed & ~blown):
+        mine = store.entities[i]
+        base.sounds.play("2d/lines", loop=True)
+        mine.cross.show()
+        mine.cross.set_color((0,1,0,1))
+    blown |= armed
+    size[armed] += numpy.float32(12*dt)
+    for i in numpy.flatnonzero(armed):
+        store.entities[i].cross.set_scale(size[i])
+    # Hittest with the players, what they cross comes from the grid
+    for player, crossing in crossings:
+        if crossing:
+            near = numpy.zeros(len(store), bool)
+            near[[mine.slot for mine in crossing]] = True
+            x, y, z = player.node.get_pos()
+            dx = numpy.float32(x)-store["x"]
+            dy = numpy.float32(y)-store["y"]
+            if (near & armed & (numpy.sqrt(dx*dx+dy*dy) < size)).any():
+                player.die()
+    for mine in store.select(time > 5):
+        mine.destroy()
 
 
 class Chaser():
+    # Just the node, the swarm moves it.
+    __slots__ = SLOTS+("node", "store", "slot")
+    speed = Field()
+
     def __init__(self, geometry, pos, speed=6):
         self.node = NodePath("segment")
         geometry.instance_to(self.node)
         self.node.reparent_to(render)
         self.node.set_pos(pos)
-        self.speed = speed
-        self.flash = False
+        base.swarm.add(self, speed)
 
     def destroy(self):
         base.chasers.remove(self)
+        base.swarm.remove(self)
+
+    def release(self):
+        base.swarm.remove(self)
         self.node.remove_node()
 
+
+class Swarm(Store):
+    # All chasers move as one. Position, velocity, heading and speed
+    # are arrays indexed by chaser.slot: a tick is a few array operations
+    # and one pass writing the nodes, however many spiders there are.
+    FIELDS = (("pos", ("f8", 2)), ("vel", ("f8", 2)), ("heading", "f8"),
+        ("speed", "f8"), ("flashed", "?"))
+
+    def __init__(self, separation=1.5, capacity=8):
+        Store.__init__(self, self.FIELDS, capacity)
+        self.separation = separation
+        # Chaser and bullet pairs tested, for telemetry.
+        self.tested = 0
+
+    def add(self, chaser, speed):
+        Store.add(self, chaser)
+        chaser.speed = speed
+        self.sync(chaser)
+
+    def sync(self, chaser):
+        # Take over wherever the node was put.
+        x, y, z = chaser.node.get_pos()
+        self.arrays["pos"][chaser.slot] = x, y
+        self.arrays["heading"][chaser.slot] = chaser.node.get_h()
+
+    def set_speed(self, speed):
+        self["speed"][:] = speed
+
+    def hit_bullets(self, pos):
+        # A bullet flashes the first chaser it touches and is gone.
+        flash = numpy.zeros(len(pos), bool)
+        bullets = base.bullets.live()
+        if not bullets:
+            return flash
+        where = numpy.array([tuple(bullet.node.get_pos())[:2] for bullet in bullets])
+        self.tested += len(bullets)*len(pos)
+        offset = where[:, None, :]-pos[None, :, :]
+        hits = (offset*offset).sum(axis=2) < 0.5*0.5
+        for b in numpy.flatnonzero(hits.any(axis=1)):
+            flash[hits[b].argmax()] = True
+            base.sounds.play("2d/bounce")
+            bullets[b].destroy()
+        return flash
+
+    def separate(self, pos):
+        # Pushes chasers apart, harder the closer they are.
+        offset = pos[:, None, :]-pos[None, :, :]
+        d2 = (offset*offset).sum(axis=2)
+        near = (d2 > 0) & (d2 < self.separation*self.separation)
+        weight = numpy.where(near, 1/numpy.maximum(d2, 1e-9), 0)
+        return (offset*weight[:, :, None]).sum(axis=1)
+
     def update(self):
-        dt = globalClock.get_dt()
-        if base.player.alive:
-            vector = base.player.node.getPos() - self.node.getPos()
-            distance = vector.get_xy().length()
-            if distance < 0.8:
-                base.player.die(spider=True)
-            vector.normalize()
-            if self.flash:
-                self.node.set_y(self.node.get_y()+1)
-
-            self.node.set_pos(self.node.get_pos()+(vector*(self.speed*dt)))
-            self.node.look_at(base.player.node)
+        n = len(self.entities)
+        if n == 0:
+            return
+        dt = base.clock.dt
+        pos = self["pos"]
+        vel = self["vel"]
+        heading = self["heading"]
+        speed = self["speed"]
+        flash = self.hit_bullets(pos)
+        players = [player for player in base.players if player.alive]
+        if players:
+            # Every chaser goes for the nearest butterfly.
+            targets = numpy.array([tuple(player.node.get_pos())[:2] for player in players])
+            vectors = targets[None, :, :]-pos[:, None, :]
+            distances = numpy.sqrt((vectors*vectors).sum(axis=2))
+            for p, player in enumerate(players):
+                if (distances[:, p] < 0.8).any():
+                    player.die(spider=True)
+            rows = numpy.arange(n)
+            nearest = distances.argmin(axis=1)
+            vector = vectors[rows, nearest]
+            distance = distances[rows, nearest]
+            px, py = targets[nearest].T
+            direction = vector/numpy.maximum(distance, 1e-9)[:, None]
+            if n > 1:
+                direction += self.separate(pos)
+                length = numpy.sqrt((direction*direction).sum(axis=1))
+                direction /= numpy.maximum(length, 1e-9)[:, None]
+            pos[flash, 1] += 1
+            vel[:] = direction*speed[:, None]
+            pos += vel*dt
+            heading[:] = numpy.degrees(numpy.arctan2(pos[:, 0]-px, py-pos[:, 1]))
         else:
-            self.node.set_pos(self.node, (0,self.speed*dt,0))
-        if self.flash:
-            self.flash = False
-            self.node.set_color(1,1,1,1)
+            # Walk on the way they were facing.
+            radians = numpy.radians(heading)
+            vel[:, 0] = -numpy.sin(radians)*speed
+            vel[:, 1] = numpy.cos(radians)*speed
+            pos += vel*dt
+        for chaser, (x, y), h in zip(self.entities, pos.tolist(), heading.tolist()):
+            chaser.node.set_pos_hpr(x, y, 0, h, 0, 0)
+        flashed = self["flashed"]
+        for i in numpy.flatnonzero(flash != flashed):
+            if flash[i]:
+                self.entities[i].node.set_color(1,1,1,1)
+            else:
+                self.entities[i].node.clear_color()
+        flashed[:] = flash
+
+
+HEAD, MID, TAIL = 0, 1, 2
+
+
+class Centipede():
+    # The head writes its (x, y, heading) into a ring buffer every tick,
+    # segment i sits where the head was i ticks ago.
+    def __init__(self, segments, history, angle=180):
+        size = 1
+        while size < len(segments)+1:
+            size *= 2
+        self.mask = size-1
+        self.xs = array("f", [0])*size
+        self.ys = array("f", [0])*size
+        self.hs = array("f", [0])*size
+        self.write = len(history)-1
+        for offset, (x, y, h) in enumerate(history):
+            self.xs[self.write-offset] = x
+            self.ys[self.write-offset] = y
+            self.hs[self.write-offset] = h
+        self.segments = segments
+        self.angle = angle
+        self.ouch = 0
+        self.link()
+        base.centipedes.append(self)
+
+    def link(self):
+        last = len(self.segments)-1
+        for index, segment in enumerate(self.segments):
+            segment.centipede = self
+            segment.index = index
+            if index == 0:          segment.set_role(HEAD)
+            elif index == last:     segment.set_role(TAIL)
+            else:                   segment.set_role(MID)
+
+    def history(self, offset):
+        i = (self.write-offset) & self.mask
+        return self.xs[i], self.ys[i], self.hs[i]
+
+    def split(self, index):
+        # Everything behind index continues as a new centipede that
+        # keeps following its own slice of the history.
+        followers = self.segments[index+1:]
+        history = [self.history(offset) for offset in range(index+1, len(self.segments))]
+        del self.segments[index:]
+        if self.segments:
+            self.link()
         else:
-            self.node.clear_color()
+            base.centipedes.remove(self)
+        if followers:
+            return Centipede(followers, history, history[0][2])
+
+    def release(self):
+        pass
+
+    def update(self):
+        dt = base.clock.dt
+        if self.ouch > 0:
+            self.ouch -= dt
+        node = self.segments[0].node
+        if randint(0,16) == 0 and self.ouch <= 0:
+            self.angle += randint(-45, 45)
+        node.set_h(self.angle)
+        node.set_pos(node, (0,1,0))
+        x, y, z = node.get_pos()
+        xsize, ysize = base.map_size
+        if x < -xsize or x > xsize or y < 0 or y > ysize:
+            base.sounds.play("2d/bounce")
+            self.angle += 180 + randint(-45, 45)
+        limit_node(node)
+        x, y, z = node.get_pos()
+        self.write = (self.write+1) & self.mask
+        self.xs[self.write] = x
+        self.ys[self.write] = y
+        self.hs[self.write] = self.angle
+        base.grid.move(self.segments[0], (x, y))
+        xs, ys, hs, mask = self.xs, self.ys, self.hs, self.mask
+        move = base.grid.move
+        i = self.write
+        for segment in self.segments[1:]:
+            i = (i-1) & mask
+            segment.node.set_pos_hpr(xs[i], ys[i], 0, hs[i], 0, 0)
+            move(segment, (xs[i], ys[i]))
+
+
+def role_models(geometry):
+    # Copies of a cent model that keep only the head, mid or tail part.
+    if not geometry in base.role_models:
+        models = []
+        for keep in ("head", "mid", "tail"):
+            model = geometry.copy_to(NodePath(geometry.name))
+            for name in ("head", "mid", "tail"):
+                if name != keep:
+                    for part in model.find_all_matches("**/"+name+"*"):
+                        part.remove_node()
+            models.append(model)
+        base.role_models[geometry] = tuple(models)
+    return base.role_models[geometry]
+
+
+def make_centipede(geometry, length=0, x=0):
+    models = role_models(geometry)
+    segments = []
+    for i in reversed(range(length+1)):
+        segments.insert(0, EnemySegment(geometry, models, x, 100+i, 180))
+    history = [(x, 100+i, 180) for i in range(length+1)]
+    return Centipede(segments, history)
 
 
 class EnemySegment():
-    def __init__(self, geometry, length=0, x=0, y=0, following=None):
+    # Draws the shared head, mid or tail model of its centipede through
+    # an instance, swapped only when its role changes. Batched, the
+    # batcher draws the role models and the node only holds a transform.
+    __slots__ = SLOTS+("node", "models", "role", "centipede", "index")
+
+    def __init__(self, geometry, models, x=0, y=0, h=0):
         self.node = NodePath("segment")
-        geometry.copy_to(self.node)
-        self.node.reparent_to(render)
-        self.node.set_y(100+y)
-        self.node.set_x(x)
-        self.following = following
-        self.follower = None
-        if length > 0:
-            self.follower = EnemySegment(
-                geometry, length=length-1, x=x, y=y+1, following=self)
-            base.segments.append(self.follower)
-        self.angle = 180
-        self.head = self.node.find("**/head*")
-        self.mid = self.node.find("**/mid*")
-        self.tail = self.node.find("**/tail*")
-        self.ouch = 0
+        self.models = models
+        self.node.reparent_to(base.batch_root)
+        self.node.set_pos_hpr(x, y, 0, h, 0, 0)
+        self.role = None
+        self.centipede = None
+        self.index = 0
+        base.segments.append(self)
+        base.grid.insert("segments", self, (x, y))
+
+    def set_role(self, role):
+        if role != self.role:
+            if not base.batch_render:
+                self.node.node().remove_all_children()
+                self.models[role].instance_to(self.node)
+            self.role = role
 
     def destroy(self, zapped=False):
-        Explosion(base.models["misc"]["explosion_a"], self.node.get_pos(), speed=uniform(1,2))
-        if self.following:
+        base.pools["explosion_a"].get(self.node.get_pos(), speed=uniform(1,2))
+        centipede = self.centipede
+        if self.index > 0:
             if not zapped:
-                Mine(self.node.get_pos())
-            self.following.follower = None
-        if self.follower:
+                base.pools["mine"].get(self.node.get_pos())
+        if self.index < len(centipede.segments)-1:
             if base.flower_time[0] >= base.flower_time[1]:
-                if not base.player.flowerpower > 0:
+                if not any(player.flowerpower > 0 for player in base.players):
                     Flower(self.node.get_pos())
+                    base.announce(choice(("here_comes_flower", "little_flower")))
                     base.flower_time[0] = 0
-            if not self.following:
-                self.follower.ouch = 0.3
+            follower = centipede.split(self.index)
+            if self.index == 0:
+                follower.ouch = 0.3
             else:
-                self.follower.angle += randint(-45,45)
-            self.follower.following = None
+                follower.angle += randint(-45,45)
+        else:
+            centipede.split(self.index)
         base.segments.remove(self)
-        self.node.remove_node()
+        base.grid.remove(self)
 
-    def update(self):
-        dt =  globalClock.get_dt()
-        if self.ouch > 0:
-            self.ouch -= dt
-        self.head.hide()
-        self.mid.hide()
-        self.tail.hide()
-        if self.following:
-            self.node.set_pos(self.following.node.get_pos())
-            if self.follower:   self.mid.show()
-            else:               self.tail.show()
-            self.angle = self.following.angle
-            self.node.set_h(self.following.angle)
-        else:
-            self.head.show()
-            if randint(0,16) == 0 and self.ouch <= 0:
-                self.angle += randint(-45, 45)
-            self.node.set_h(self.angle)
-            self.node.set_pos(self.node, (0,1,0))
-            x, y, z = self.node.get_pos()
-            xsize, ysize = base.map_size
-            if x < -xsize or x > xsize or y < 0 or y > ysize:
-                base.sounds["2d"]["bounce"].play()
-                self.angle += 180 + randint(-45, 45)
-            limit_node(self.node)
-
-        vector = base.player.node.getPos() - self.node.getPos()
-        distance = vector.get_xy().length()
-        if distance < 0.8:
-            base.player.die()
+    def release(self):
+        self.node.remove_node()
 
 
 class Bullet():
-    def __init__(self, pos, scale=1):
+    __slots__ = SLOTS+("node", "scale", "owner", "pool", "store", "slot")
+    # y and the stretch are float32 like the node, speed is not.
+    FIELDS = (("y", "f4"), ("sy", "f4"), ("speed", "f8"))
+    y = Field()
+    sy = Field()
+    speed = Field()
+
+    def __init__(self):
+        self.slot = None
         self.node = NodePath("bullet")
         base.models["misc"]["bullet"].instance_to(self.node)
-        self.node.reparent_to(render)
+        self.node.reparent_to(base.batch_root)
+
+    def spawn(self, pos, scale=1, owner=None):
         pos.y += 1
         self.node.set_sy(0.1)
         self.node.set_scale(scale)
         self.node.set_pos(pos)
         base.bullets.append(self)
-        self.speed = 0.4
+        base.stores["bullets"].add(self)
+        self.sync()
+        self.speed = 24
         self.scale = scale
+        self.owner = owner or base.player
+
+    def sync(self):
+        # Take over wherever the node was put.
+        self.y = self.node.get_y()
+        self.sy = self.node.get_sy()
 
     def destroy(self):
-        self.node.remove_node()
         base.bullets.remove(self)
-
-    def update(self):
-        y = self.node.get_y()
-        self.node.set_y(y+self.speed)
-
-        scale = self.node.get_sy()
-        if scale < 1:
-            self.node.set_sy(scale+0.1)
-        if y > 50:
+        base.stores["bullets"].remove(self)
+
+    def release(self):
+        base.stores["bullets"].remove(self)
+        self.pool.put(self)
+
+    def collide(self):
+        pos = self.node.get_pos()
+        for segment in base.grid.query("segments", pos, 0.5):
+            player = self.owner
+            if segment.index == 0:
+                player.combo_time = 0.1
+                player.combo += 1
+                if player.combo > player.max_combo:
+                    base.announce("super_combo")
+                    base.sounds.play("2d/combo")
+                    prize = 1000
+                    player.combo = 0
+                else:
+                    prize = 50*player.combo
+                base.pools["score"].get(self.node.get_pos(), prize)
+            else:
+                base.pools["score"].get(self.node.get_pos(), 10)
+                player.combo_time = 0
+            segment.destroy()
             self.destroy()
+            player.flowerpower += 0.05
             return
-        x, y, z = self.node.get_pos()
-        enemy_size = self.scale
-        me_size = 0.1
-        for segment in base.segments:
-            vector = segment.node.getPos() - self.node.getPos()
-            distance = vector.get_xy().length()
-            if distance < 0.5:
-                player = base.player
-                if not segment.following:
-                    player.combo_time = 0.1
-                    player.combo += 1
-                    if base.player.combo > player.max_combo:
-                        base.announce("super_combo")
-                        base.sounds["2d"]["combo"].play()
-                        prize = "1000"
-                        player.combo = 0
-                    else:
-                        prize = str(50*player.combo)
-                    Score(self.node.get_pos(), prize)
-                else:
-                    Score(self.node.get_pos(), "10")
-                    player.combo_time = 0
-                segment.destroy()
-                self.destroy()
-                player.flowerpower += 0.05
-                return
-
-        for chaser in base.chasers:
-            vector = chaser.node.getPos() - self.node.getPos()
-            distance = vector.get_xy().length()
-            if distance < 0.5:
-                chaser.flash = True
-                base.sounds["2d"]["bounce"].play()
-                self.destroy()
-                return
+        # Hitting chasers is up to the swarm.
+
+
+def move_bullets(dt):
+    # Returns the bullets that were already off the map, they go without
+    # hitting anything.
+    store = base.stores["bullets"]
+    if not len(store):
+        return set()
+    y, sy = store["y"], store["sy"]
+    gone = y > 50
+    y[:] = y+store["speed"]*dt
+    short = numpy.flatnonzero(sy < 1)
+    sy[short] += 6*dt
+    for bullet, value in zip(store.entities, y.tolist()):
+        bullet.node.set_y(value)
+    for i in short:
+        store.entities[i].node.set_sy(sy[i])
+    return set(store.entities[i] for i in numpy.flatnonzero(gone))
 
 
 class Player():
-    def __init__(self):
-        self.node = Actor("models/butterfly.bam")
+    # number 0 is the first butterfly, 1 the one of the second player.
+    def __init__(self, number=0):
+        self.number = number
+        self.node = base.animated("butterfly", "flap")
+        if number:
+            self.node.set_color_scale(0.4, 1, 1, 1)
         self.node.set_scale(0.4)
         self.node.reparent_to(render)
-        self.node.loop("flap")
         self.node.hide()
         self.bullet_timer = [0, 0.1]
         self.movement = [0, 0, 0]
@@ -346,7 +620,7 @@ class Player():
         self.zapping = self.flowerpower = 0
 
     def update(self):
-        dt = globalClock.get_dt()
+        dt = base.clock.dt
         if self.combo_time > 0:
             self.combo_time -= dt
         else:
@@ -354,7 +628,7 @@ class Player():
                 base.announce("so_close")
             self.combo = 0
 
-        context = base.device_listener.read_context('game')
+        context = base.game_input(self)
         gx, gy = context["movement"]
         for a, axis in enumerate((gx, gy)):
             accel = self.accel*dt
@@ -385,12 +659,11 @@ class Player():
 
         self.bullet_timer[0] += dt
         if self.bullet_timer[0] > self.bullet_timer[1]:
-            base.sounds["2d"]["bullet"].set_play_rate(uniform(0.8,1.2))
-            base.sounds["2d"]["bullet"].play()
+            base.sounds.play("2d/bullet", rate=uniform(0.8,1.2))
             self.bullet_timer[0] -= self.bullet_timer[1]
             pos = self.node.get_pos()
             pos.x += offset
-            Bullet(pos, scale)
+            base.pools["bullet"].get(pos, scale, self)
 
         if self.zapping > 0:
             self.zapping -= dt
@@ -401,27 +674,32 @@ class Player():
 
     def zap(self):
         if len(base.mines) > 0:
-            base.sounds["2d"]["zap_a"].play()
-            mine = choice(base.mines)
+            base.sounds.play("2d/zap_a")
+            mine = choice(base.mines.live())
             base.zapline(self.node, mine.node)
             mine.destroy()
         if len(base.segments) > 0:
-            base.sounds["2d"]["zap_a"].play()
-            segment = choice(base.segments)
+            base.sounds.play("2d/zap_a")
+            segment = choice(base.segments.live())
             base.zapline(self.node, segment.node)
-            Score(segment.node.get_pos(), "10")
+            base.pools["score"].get(segment.node.get_pos(), 10)
             segment.destroy(zapped=True)
 
     def die(self, spider=False):
         if self.alive:
-            while len(base.bullets) > 0: base.bullets[0].destroy()
-            base.sounds["2d"]["die"].play()
+            base.bullets.clear()
+            base.sounds.play("2d/die")
             self.node.hide()
-            Explosion(base.models["misc"]["explosion_b"], self.node.get_pos(), speed=3)
-
-            base.lives -= 1
-            if base.lives > 0:
-                extra = str(base.lives) +" lives left!\n\nspace to spawn"
+            base.pools["explosion_b"].get(self.node.get_pos(), speed=3)
+
+            # Co-op shares the lives, the last one standing plays on.
+            base.lives = max(0, base.lives-1)
+            standing = [player for player in base.players if player.alive and player is not self]
+            if base.lives > 0 or standing:
+                if base.lives > 0:
+                    extra = str(base.lives) +" lives left!\n\nspace to spawn"
+                else:
+                    extra = "last butterfly standing!"
                 if not spider:
                     base.announce(choice(("you_die", "die")), extra)
                 else:
@@ -435,5 +713,5 @@ class Player():
 
                 base.announce("game_over", extra)
                 base.music.set_volume(0)
-                base.sounds["2d"]["gameover"].play()
+                base.sounds.play("2d/gameover")
         self.alive = False
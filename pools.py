@@ -0,0 +1,44 @@
+class Pool():
+    # Keeps released entities parented and hidden so the next spawn can
+    # reuse them instead of building a new NodePath.
+    def __init__(self, factory, *args, cap=256):
+        self.factory = factory
+        self.args = args
+        self.cap = cap
+        self.free = []
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, *args, **kwargs):
+        if self.free:
+            self.hits += 1
+            entity = self.free.pop()
+            entity.node.show()
+        else:
+            self.misses += 1
+            entity = self.factory(*self.args)
+            entity.pool = self
+        entity.spawn(*args, **kwargs)
+        return entity
+
+    def put(self, entity):
+        if len(self.free) < self.cap:
+            entity.node.hide()
+            self.free.append(entity)
+        else:
+            entity.node.remove_node()
+
+    def warm(self, amount):
+        while len(self.free) < min(amount, self.cap):
+            entity = self.factory(*self.args)
+            entity.pool = self
+            entity.node.hide()
+            self.free.append(entity)
+
+
+def pool_report(pools):
+    # How often a get() found something to reuse, per pool.
+    lines = ["{:<14}{:>8}{:>8}{:>8}".format("pool", "free", "hits", "misses")]
+    for name, pool in pools.items():
+        lines.append("{:<14}{:>8}{:>8}{:>8}".format(name, len(pool.free), pool.hits, pool.misses))
+    return "\n".join(lines)
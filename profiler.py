@@ -0,0 +1,90 @@
+from time import perf_counter
+
+from panda3d.core import PStatCollector, TextNode
+
+
+PHASES = (
+    "announcement", "player", "background", "explosions", "bullets",
+    "mines", "chasers", "flowers", "scores", "segments", "rules",
+    "batches", "hud", "camera", "mirror",
+)
+
+
+class FrameProfiler():
+    # One PStats collector per phase of update_objects, plus a rolling
+    # average of the same timings for the on-screen overlay.
+    def __init__(self, smoothing=0.05):
+        self.collectors = {}
+        self.updates = {}
+        for phase in PHASES:
+            self.collectors[phase] = PStatCollector("App:Update:"+phase.title())
+            self.updates[phase] = PStatCollector("Updates:"+phase.title())
+        self.smoothing = smoothing
+        self.frame = dict.fromkeys(PHASES, 0.0)
+        self.average = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(PHASES, 0)
+        self.started = 0
+        self.overlay = None
+        self.overlay_time = 0
+
+    def start(self, phase):
+        self.collectors[phase].start()
+        self.started = perf_counter()
+
+    def stop(self, phase):
+        self.frame[phase] += perf_counter()-self.started
+        self.collectors[phase].stop()
+
+    def count(self, phase, amount):
+        self.updates[phase].set_level(amount)
+        self.counts[phase] = amount
+
+    def end_frame(self, dt, entities):
+        for phase in PHASES:
+            ms = self.frame[phase]*1000
+            self.average[phase] += (ms-self.average[phase])*self.smoothing
+            self.frame[phase] = 0.0
+        if self.overlay and not self.overlay.is_hidden():
+            self.overlay_time -= dt
+            if self.overlay_time <= 0:
+                self.overlay_time = 0.25
+                self.write_overlay(entities)
+
+    def toggle_overlay(self, font):
+        if self.overlay is None:
+            text = TextNode("profiler")
+            text.font = font
+            text.align = TextNode.A_right
+            text.set_text_color((1,1,0,1))
+            self.overlay = base.a2dTopRight.attach_new_node(text)
+            self.overlay.set_scale(0.03)
+            self.overlay.set_pos(-0.05, 0, -0.08)
+        elif self.overlay.is_hidden():
+            self.overlay.show()
+        else:
+            self.overlay.hide()
+
+    def write_overlay(self, entities):
+        lines = []
+        total = 0
+        for phase in PHASES:
+            ms = self.average[phase]
+            total += ms
+            lines.append("{} {:6.2f}ms {:4}".format(phase.upper(), ms, self.counts[phase]))
+        lines.append("TOTAL {:6.2f}ms".format(total))
+        scheduler = base.scheduler
+        lines.append("SLOWDOWN x{} OVERRUNS {}".format(scheduler.slowdown, scheduler.overruns()))
+        if base.lockstep:
+            lines.append(base.lockstep.report())
+        lines.append("")
+        for kind, items in entities.kinds.items():
+            lines.append("{} {:4}".format(kind.upper(), len(items)))
+        voices = base.sounds
+        lines.append("")
+        lines.append("VOICES {:2}/{}".format(voices.active, voices.budget))
+        lines.append("DROPPED {:4}".format(voices.dropped))
+        lines.append("AUDIO {:6.0f}KB".format(voices.resident_bytes()/1024))
+        lines.append("")
+        for name, pool in base.pools.items():
+            lines.append("{} HITS {:4} MISSES {:3}".format(name.upper(), pool.hits, pool.misses))
+        self.overlay.node().text = "\n".join(lines)
@@ -0,0 +1,103 @@
+SLOT_BITS = 20
+SLOT_MASK = (1 << SLOT_BITS)-1
+# What an EntityList keeps on its entities, for classes with __slots__.
+SLOTS = ("eid", "alive", "dense_index")
+
+
+class EntityList():
+    # Dense storage for one kind of entity. Removal is deferred until
+    # flush() so the list can be iterated while entities die, and then
+    # swaps the last entity into the hole instead of shifting the list.
+    def __init__(self, registry, kind):
+        self.registry = registry
+        self.kind = kind
+        self.dense = []
+        self.pending = []
+
+    def __len__(self):
+        return len(self.dense)-len(self.pending)
+
+    def __iter__(self):
+        for entity in self.dense:
+            if entity.alive:
+                yield entity
+
+    def live(self):
+        return [entity for entity in self.dense if entity.alive]
+
+    def append(self, entity):
+        entity.eid = self.registry.allocate(entity)
+        entity.alive = True
+        entity.dense_index = len(self.dense)
+        self.dense.append(entity)
+
+    def remove(self, entity):
+        if entity.alive:
+            entity.alive = False
+            self.pending.append(entity)
+
+    def flush(self):
+        dense = self.dense
+        for entity in self.pending:
+            last = dense.pop()
+            if last is not entity:
+                dense[entity.dense_index] = last
+                last.dense_index = entity.dense_index
+            self.registry.free(entity.eid)
+            entity.release()
+        self.pending.clear()
+
+    def clear(self):
+        # Bulk despawn, no gameplay side effects. Not safe while the
+        # same list is being iterated.
+        for entity in self.dense:
+            entity.alive = False
+            self.registry.free(entity.eid)
+            entity.release()
+        self.dense.clear()
+        self.pending.clear()
+
+
+class Registry():
+    # Hands out generational ids: the low bits are a slot that gets
+    # reused, the high bits a generation that changes on every reuse, so
+    # a stale id never resolves to the entity that took over its slot.
+    def __init__(self):
+        self.kinds = {}
+        self.entities = []
+        self.generations = []
+        self.free_slots = []
+
+    def kind(self, kind):
+        if not kind in self.kinds:
+            self.kinds[kind] = EntityList(self, kind)
+        return self.kinds[kind]
+
+    def allocate(self, entity):
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.entities[slot] = entity
+        else:
+            slot = len(self.entities)
+            self.entities.append(entity)
+            self.generations.append(0)
+        return (self.generations[slot] << SLOT_BITS) | slot
+
+    def free(self, eid):
+        slot = eid & SLOT_MASK
+        self.entities[slot] = None
+        self.generations[slot] += 1
+        self.free_slots.append(slot)
+
+    def get(self, eid):
+        slot = eid & SLOT_MASK
+        if slot < len(self.entities) and self.generations[slot] == eid >> SLOT_BITS:
+            return self.entities[slot]
+
+    def flush(self):
+        for entities in self.kinds.values():
+            entities.flush()
+
+    def clear(self):
+        for entities in self.kinds.values():
+            entities.clear()
@@ -0,0 +1,400 @@
+import zlib
+import json
+import struct
+from array import array
+from collections import defaultdict
+
+from panda3d.core import Point3
+
+import rng
+from lines import draw_lines
+from objects import Chaser, Flower, EnemySegment, Centipede, role_models
+
+
+# A replay file is a header, then chunks:
+#   I  a run of ticks with the same input: count, x, y, spawn
+#   K  a full keyframe of the game state: tick, size, zlib'd JSON
+#   X  the index of keyframes: count, then tick and file offset each
+# and a footer pointing at the index. A file without an index (the
+# game crashed) is scanned for keyframes instead.
+HEADER = struct.Struct("<4sBHq")
+RUN = struct.Struct("<HbbB")
+KEYFRAME = struct.Struct("<II")
+INDEX = struct.Struct("<I")
+ENTRY = struct.Struct("<IQ")
+FOOTER = struct.Struct("<Q4s")
+MAGIC = b"GFRP"
+INDEX_MAGIC = b"GFRX"
+VERSION = 3
+
+GAME = (
+    "score", "lives", "level", "wave", "highscore", "extra_life",
+    "text_timer", "first",
+)
+PLAYER = (
+    "alive", "zapping", "flowerpower", "flower_time", "combo",
+    "combo_time", "highscore", "max_combo",
+)
+
+# What save_state writes, as JSON gives it back. A list is a fixed
+# record, a list ending in ... any number of its first item, anything
+# else is checked with isinstance. Replays are passed around, so a
+# keyframe is only loaded if it has exactly this shape.
+NUMBER = (int, float)
+VEC3 = [NUMBER, NUMBER, NUMBER]
+TRANSFORM = [VEC3, VEC3, VEC3]
+ENTRY_STATE = [int, NUMBER, NUMBER]
+STATE = {
+    "tick": int,
+    "rng": [int, [int, ...], (float, type(None))],
+    "game": {name: NUMBER for name in GAME},
+    "segment_time": [NUMBER, ...],
+    "flower_time": [NUMBER, ...],
+    "announcement": str,
+    "hud": bool,
+    "order": int,
+    "player": {name: (int, float, type(None)) for name in PLAYER},
+    "player_node": [TRANSFORM, bool],
+    "movement": [NUMBER, ...],
+    "bullet_timer": [NUMBER, ...],
+    "segments": [[str, TRANSFORM, ENTRY_STATE], ...],
+    "centipedes": [[[int, ...], [NUMBER, ...], [NUMBER, ...], [NUMBER, ...],
+        int, int, NUMBER, NUMBER], ...],
+    "chasers": [[TRANSFORM, NUMBER], ...],
+    "mines": [[TRANSFORM, NUMBER, NUMBER, NUMBER, ENTRY_STATE], ...],
+    "bullets": [[TRANSFORM, NUMBER, NUMBER], ...],
+    "explosions": [[str, TRANSFORM, NUMBER, NUMBER, [NUMBER]*4], ...],
+    "scores": [[TRANSFORM, NUMBER], ...],
+    "flowers": [[TRANSFORM, NUMBER, NUMBER], ...],
+}
+
+
+def quantize(axis):
+    return max(-127, min(127, int(round(axis*127))))
+
+
+def transform(node):
+    return tuple(node.get_pos()), tuple(node.get_hpr()), tuple(node.get_scale())
+
+
+def set_transform(node, saved):
+    pos, hpr, scale = saved
+    node.set_pos_hpr_scale(tuple(pos), tuple(hpr), tuple(scale))
+
+
+def restore_entry(grid, entity, entry):
+    order, x, y = entry
+    grid.move(entity, (x, y))
+    grid.entry(entity)[0] = order
+
+
+def save_state(app):
+    # Everything the simulation reads, in the order the registry and the
+    # grid hold it, so a restored game plays on exactly the same.
+    grid = app.grid
+    pools = {id(pool): name for name, pool in app.pools.items()}
+    segments = list(app.segments)
+    dense = {segment: i for i, segment in enumerate(segments)}
+    player = app.player
+    state = {
+        "tick": app.clock.tick,
+        "rng": rng.rng.getstate(),
+        "game": {name: getattr(app, name) for name in GAME},
+        "segment_time": list(app.segment_time),
+        "flower_time": list(app.flower_time),
+        "announcement": app.announcement.text,
+        "hud": not app.hud.node.is_hidden(),
+        "order": grid.order,
+        "player": {name: getattr(player, name, None) for name in PLAYER},
+        "player_node": (transform(player.node), player.node.is_hidden()),
+        "movement": list(player.movement),
+        "bullet_timer": list(player.bullet_timer),
+        "segments": [(segment.models[0].name, transform(segment.node),
+            list(grid.entry(segment))) for segment in segments],
+        "centipedes": [([dense[s] for s in c.segments], c.xs.tolist(),
+            c.ys.tolist(), c.hs.tolist(), c.write, c.mask, c.angle, c.ouch)
+            for c in app.centipedes],
+        "chasers": [(transform(c.node), c.speed) for c in app.chasers],
+        "mines": [(transform(m.node), m.time, m.blown, m.size,
+            list(grid.entry(m))) for m in app.mines],
+        "bullets": [(transform(b.node), b.speed, b.scale) for b in app.bullets],
+        "explosions": [(pools[id(e.pool)], transform(e.node), e.time, e.speed,
+            tuple(e.node.get_color_scale())) for e in app.explosions],
+        "scores": [(transform(s.node), s.score) for s in app.scores],
+        "flowers": [(transform(f.node), f.time, f.flowerpower) for f in app.flowers],
+    }
+    return state
+
+
+def load_state(app, state):
+    app.destroy()
+    if app.first and not state["game"]["first"]:
+        draw_lines(app)
+    grid = app.grid
+
+    segments = []
+    for name, saved, entry in state["segments"]:
+        geometry = app.models["enemies"][name]
+        (x, y, z), (h, p, r), scale = saved
+        segment = EnemySegment(geometry, role_models(geometry), x, y, h)
+        set_transform(segment.node, saved)
+        restore_entry(grid, segment, entry)
+        segments.append(segment)
+    for indices, xs, ys, hs, write, mask, angle, ouch in state["centipedes"]:
+        centipede = Centipede([segments[i] for i in indices], [], angle)
+        centipede.xs = array("f", xs)
+        centipede.ys = array("f", ys)
+        centipede.hs = array("f", hs)
+        centipede.write = write
+        centipede.mask = mask
+        centipede.ouch = ouch
+    for saved, speed in state["chasers"]:
+        chaser = Chaser(app.models["chasers"]["spider"], Point3(*saved[0]), speed)
+        set_transform(chaser.node, saved)
+        app.swarm.sync(chaser)
+        app.chasers.append(chaser)
+    for saved, time, blown, cross, entry in state["mines"]:
+        mine = app.pools["mine"].get(Point3(*saved[0]))
+        set_transform(mine.node, saved)
+        mine.time = time
+        mine.blown = blown
+        mine.size = cross
+        mine.cross.set_scale(cross)
+        if blown:
+            mine.cross.show()
+            mine.cross.set_color((0,1,0,1))
+        restore_entry(grid, mine, entry)
+    for saved, speed, scale in state["bullets"]:
+        bullet = app.pools["bullet"].get(Point3(*saved[0]), scale)
+        set_transform(bullet.node, saved)
+        bullet.sync()
+        bullet.speed = speed
+    for name, saved, time, speed, color in state["explosions"]:
+        explosion = app.pools[name].get(Point3(*saved[0]), speed)
+        set_transform(explosion.node, saved)
+        explosion.time = time
+        explosion.scale = saved[2][0]
+        explosion.node.set_color_scale(tuple(color))
+    for saved, score in state["scores"]:
+        popup = app.pools["score"].get(Point3(*saved[0]), score)
+        set_transform(popup.node, saved)
+    for saved, time, flowerpower in state["flowers"]:
+        flower = Flower(Point3(*saved[0]))
+        set_transform(flower.node, saved)
+        flower.time = time
+        flower.flowerpower = flowerpower
+    grid.order = state["order"]
+
+    player = app.player
+    for name, value in state["player"].items():
+        if value is not None:
+            setattr(player, name, value)
+    saved, hidden = state["player_node"]
+    set_transform(player.node, saved)
+    if hidden:
+        player.node.hide()
+    else:
+        player.node.show()
+    player.movement = list(state["movement"])
+    player.bullet_timer = list(state["bullet_timer"])
+
+    for name, value in state["game"].items():
+        setattr(app, name, value)
+    app.segment_time = list(state["segment_time"])
+    app.flower_time = list(state["flower_time"])
+    app.announcement.text = state["announcement"]
+    if state["hud"]:
+        app.hud.node.show()
+    app.clock.tick = state["tick"]
+    version, internal, gauss = state["rng"]
+    rng.rng.setstate((version, tuple(internal), gauss))
+    # Restoring spawned things through their pools, which queued their
+    # spawn sounds. Only the mine lines keep playing.
+    app.sounds.queue.clear()
+    if any(mine.blown for mine in app.mines):
+        app.sounds.play("2d/lines", loop=True)
+
+
+def valid(value, shape):
+    if isinstance(shape, dict):
+        return (isinstance(value, dict) and value.keys() == shape.keys()
+            and all(valid(value[name], shape[name]) for name in shape))
+    if isinstance(shape, list) and shape[-1:] == [...]:
+        return isinstance(value, list) and all(valid(item, shape[0]) for item in value)
+    if isinstance(shape, list):
+        return (isinstance(value, list) and len(value) == len(shape)
+            and all(valid(item, part) for item, part in zip(value, shape)))
+    return isinstance(value, shape)
+
+
+def encode_state(state):
+    return zlib.compress(json.dumps(state).encode())
+
+
+def decode_state(data):
+    try:
+        state = json.loads(zlib.decompress(data))
+    except (zlib.error, ValueError) as error:
+        raise ValueError("broken keyframe") from error
+    if not valid(state, STATE):
+        raise ValueError("keyframe does not hold a game state")
+    count = len(state["segments"])
+    for centipede in state["centipedes"]:
+        if not all(0 <= i < count for i in centipede[0]):
+            raise ValueError("keyframe centipede has no such segment")
+    return state
+
+
+def checksum(app):
+    return zlib.crc32(json.dumps(save_state(app)).encode())
+
+
+class Recorder():
+    # Sits between the game and the real input. Once per tick it samples
+    # the game context, quantizes it the way it is stored, and hands the
+    # game the stored value, so recording and playback see the same.
+    def __init__(self, path, seed, tick_rate=60, keyframe_every=1800):
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, tick_rate, seed))
+        self.keyframe_every = keyframe_every
+        self.source = None
+        self.run = None
+        self.count = 0
+        self.index = []
+        self.last_keyframe = None
+        self.sample = None
+
+    def read_context(self, context):
+        if context != "game":
+            return self.source.read_context(context)
+        return self.sample
+
+    def begin_tick(self, app):
+        if self.last_keyframe is None or app.clock.tick-self.last_keyframe >= self.keyframe_every:
+            self.keyframe(app)
+        context = self.source.read_context("game")
+        x, y = context["movement"]
+        run = quantize(x), quantize(y), bool(context["spawn"])
+        if run != self.run or self.count == 0xffff:
+            self.flush()
+            self.run = run
+        self.count += 1
+        self.sample = {"movement": (run[0]/127, run[1]/127), "spawn": run[2]}
+
+    def flush(self):
+        if self.count:
+            x, y, spawn = self.run
+            self.file.write(b"I"+RUN.pack(self.count, x, y, spawn))
+        self.count = 0
+
+    def keyframe(self, app):
+        self.flush()
+        self.last_keyframe = app.clock.tick
+        self.index.append((app.clock.tick, self.file.tell()))
+        data = encode_state(save_state(app))
+        self.file.write(b"K"+KEYFRAME.pack(app.clock.tick, len(data))+data)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        offset = self.file.tell()
+        self.file.write(b"X"+INDEX.pack(len(self.index)))
+        for tick, position in self.index:
+            self.file.write(ENTRY.pack(tick, position))
+        self.file.write(FOOTER.pack(offset, INDEX_MAGIC))
+        self.file.close()
+
+
+class Replay():
+    # Plays a recording back as the game's input source. seek() jumps to
+    # the last keyframe before a tick and simulates only the rest, a
+    # replay starts with a seek to its first keyframe.
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        magic, version, self.tick_rate, self.seed = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a gridfly replay".format(path))
+        self.start = self.file.tell()
+        self.index = self.read_index() or self.scan()
+        self.source = None
+        self.finished = False
+        self.run_end = 0
+        self.sample = None
+        self.file.seek(self.start)
+
+    def read_index(self):
+        self.file.seek(0, 2)
+        if self.file.tell() < self.start+FOOTER.size:
+            return None
+        self.file.seek(-FOOTER.size, 2)
+        offset, magic = FOOTER.unpack(self.file.read(FOOTER.size))
+        if magic != INDEX_MAGIC:
+            return None
+        self.file.seek(offset+1)
+        count, = INDEX.unpack(self.file.read(INDEX.size))
+        return [ENTRY.unpack(self.file.read(ENTRY.size)) for i in range(count)]
+
+    def scan(self):
+        index = []
+        self.file.seek(self.start)
+        while True:
+            position = self.file.tell()
+            kind = self.file.read(1)
+            if kind == b"I":
+                self.file.seek(RUN.size, 1)
+            elif kind == b"K":
+                header = self.file.read(KEYFRAME.size)
+                if len(header) < KEYFRAME.size:
+                    break
+                tick, size = KEYFRAME.unpack(header)
+                index.append((tick, position))
+                self.file.seek(size, 1)
+            else:
+                break
+        return index
+
+    def read_context(self, context):
+        if context != "game":
+            if self.source:
+                return self.source.read_context(context)
+            return defaultdict(bool)
+        return self.sample
+
+    def begin_tick(self, app):
+        while app.clock.tick >= self.run_end and not self.finished:
+            self.next_run()
+        if self.finished:
+            self.sample = {"movement": (0, 0), "spawn": False}
+
+    def next_run(self):
+        while True:
+            kind = self.file.read(1)
+            if kind == b"I":
+                count, x, y, spawn = RUN.unpack(self.file.read(RUN.size))
+                self.run_end += count
+                self.sample = {"movement": (x/127, y/127), "spawn": bool(spawn)}
+                return
+            elif kind == b"K":
+                tick, size = KEYFRAME.unpack(self.file.read(KEYFRAME.size))
+                self.file.seek(size, 1)
+            else:
+                self.finished = True
+                return
+
+    def seek(self, app, tick):
+        keyframes = [entry for entry in self.index if entry[0] <= tick]
+        if not keyframes:
+            raise ValueError("no keyframe before tick {}".format(tick))
+        start, position = keyframes[-1]
+        self.file.seek(position+1)
+        start, size = KEYFRAME.unpack(self.file.read(KEYFRAME.size))
+        load_state(app, decode_state(self.file.read(size)))
+        self.run_end = start
+        self.finished = False
+        while app.clock.tick < tick:
+            app.tick()
+        app.zaplines.clear()
+
+    def close(self):
+        self.file.close()
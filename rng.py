@@ -0,0 +1,13 @@
+from random import Random
+
+
+# One generator for all gameplay randomness, so a seeded run plays out
+# the same every time.
+rng = Random()
+randint = rng.randint
+choice = rng.choice
+uniform = rng.uniform
+
+
+def seed(value=None):
+    rng.seed(value)
@@ -0,0 +1,479 @@
+import time
+import multiprocessing
+from collections import defaultdict
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy
+
+from panda3d.core import ExecutionEnvironment
+
+from objects import role_models
+
+
+# Runs the simulation (a headless GameApp calling tick()) in its own
+# process, so it overlaps with cull and draw instead of sharing their
+# core. Everything crosses in one shared memory block, no pickling:
+#   control  the render side's input and how far to simulate
+#   slots    two snapshots of the game, written in turn. Each has a
+#            sequence number that is odd while it is being written, a
+#            reader copies a slot and retries if the number changed.
+#   events   a ring of sounds and zaplines, the worker counts what it
+#            wrote and the render side what it read.
+# The render side draws the newest snapshot, one frame behind.
+PLAYER, SEGMENT, CHASER, MINE, BULLET, EXPLOSION, SCORE, FLOWER = range(8)
+KIND_NAMES = ("player", "segment", "chaser", "mine", "bullet", "explosion", "score", "flower")
+SHOWN, FLASH, BLOWN = 1, 2, 4
+PLAYER_ID = 0xffffffff
+EXPLOSIONS = ("explosion_a", "explosion_b")
+SOUND_PLAY, SOUND_STOP, SOUND_GROUP, ZAP = range(4)
+
+ENTITIES = 4096
+EVENTS = 4096
+ENTITY = numpy.dtype([
+    ("kind", "u1"),
+    ("flags", "u1"),
+    ("eid", "<u4"),
+    # Segments: model and role, explosions: which one, scores: value.
+    ("look", "<i4"),
+    ("pos", "<f4", 3),
+    ("hpr", "<f4", 3),
+    ("scale", "<f4", 3),
+    # Explosions: alpha, mines: size of the cross.
+    ("extra", "<f4"),
+])
+HEADER = (
+    "tick", "score", "highscore", "lives", "level", "wave", "started",
+    "announced", "music", "bg_alpha", "text",
+)
+SLOT = numpy.dtype([
+    ("seq", "<u8"),
+    ("tick", "<u8"),
+    ("score", "<i8"),
+    ("highscore", "<i8"),
+    ("lives", "<i4"),
+    ("level", "<i4"),
+    ("wave", "<i4"),
+    ("started", "u1"),
+    ("announced", "<u4"),
+    ("music", "<f4"),
+    ("bg_alpha", "<f4"),
+    ("text", "S256"),
+    ("count", "<u4"),
+    ("entities", ENTITY, (ENTITIES,)),
+])
+EVENT = numpy.dtype([
+    ("kind", "u1"),
+    ("loop", "u1"),
+    ("key", "S32"),
+    ("rate", "<f4"),
+    ("a", "<f4", 3),
+    ("b", "<f4", 3),
+    ("color", "<f4", 4),
+    ("thickness", "u1"),
+])
+CONTROL = numpy.dtype([
+    ("target", "<u8"),
+    ("written", "<u8"),
+    ("presses", "<u8"),
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("latest", "u1"),
+    ("ready", "u1"),
+    ("quit", "u1"),
+])
+
+
+class SharedState():
+    def __init__(self, name=None):
+        size = CONTROL.itemsize+SLOT.itemsize*2+EVENT.itemsize*EVENTS
+        if name is None:
+            self.memory = SharedMemory(create=True, size=size)
+        else:
+            self.memory = SharedMemory(name)
+        buffer = self.memory.buf
+        self.control = numpy.ndarray((), CONTROL, buffer, 0)
+        self.slots = numpy.ndarray((2,), SLOT, buffer, CONTROL.itemsize)
+        self.events = numpy.ndarray((EVENTS,), EVENT, buffer,
+            CONTROL.itemsize+SLOT.itemsize*2)
+
+    def close(self, unlink=False):
+        # The views have to go before the memory can be closed.
+        self.control = self.slots = self.events = None
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+class Events():
+    def __init__(self, state):
+        self.state = state
+        self.written = 0
+
+    def push(self, kind, key=b"", rate=1, loop=False, a=(0,0,0), b=(0,0,0), color=(0,0,0,0), thickness=0):
+        self.state.events[self.written%EVENTS] = (kind, loop, key, rate, a, b, color, thickness)
+        self.written += 1
+
+
+class SoundEvents():
+    # Stands in for Voices in the worker. tick() stops the mine lines
+    # every tick there are no mines, only stops of something that was
+    # played are passed on.
+    def __init__(self, events):
+        self.events = events
+        self.played = set()
+        self.queue = []
+
+    def play(self, key, rate=1, loop=False):
+        self.played.add(key)
+        self.events.push(SOUND_PLAY, key.encode(), rate, loop)
+
+    def stop(self, key):
+        if key in self.played:
+            self.played.discard(key)
+            self.events.push(SOUND_STOP, key.encode())
+
+    def stop_group(self, group):
+        self.events.push(SOUND_GROUP, group.encode())
+
+    def update(self):
+        pass
+
+
+class ZapEvents():
+    # Stands in for the zapline LineBuffer in the worker.
+    def __init__(self, events):
+        self.events = events
+
+    def add(self, a, b, color, thickness):
+        self.events.push(ZAP, a=tuple(a), b=tuple(b), color=tuple(color), thickness=thickness)
+
+    def clear(self):
+        pass
+
+    def update(self):
+        pass
+
+
+class Music():
+    # The worker has no music, it only remembers how loud it should be.
+    def __init__(self):
+        self.volume = 1
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+    def get_volume(self):
+        return self.volume
+
+
+class SharedInput():
+    def __init__(self, state):
+        self.state = state
+        self.presses = 0
+        self.spawn = False
+
+    def next_tick(self):
+        # Spawn is pressed for the first tick after a press, however many
+        # frames the parent drew without a tick in between.
+        presses = int(self.state.control["presses"])
+        self.spawn = presses > self.presses
+        self.presses = presses
+
+    def read_context(self, context):
+        if context != "game":
+            return defaultdict(bool)
+        control = self.state.control
+        return {"movement": (float(control["x"]), float(control["y"])), "spawn": self.spawn}
+
+
+def transform(node):
+    state = node.get_transform()
+    return tuple(state.get_pos()), tuple(state.get_hpr()), tuple(state.get_scale())
+
+
+class Publisher():
+    def __init__(self, app, state, events):
+        self.app = app
+        self.state = state
+        self.events = events
+        self.looks = {name: i for i, name in enumerate(sorted(app.models["enemies"]))}
+        self.slot = 0
+
+    def rows(self):
+        app = self.app
+        node = app.player.node
+        yield (PLAYER, 0 if node.is_hidden() else SHOWN, PLAYER_ID, 0, *transform(node), 0)
+        for segment in app.segments:
+            look = self.looks[segment.models[0].name]*3+segment.role
+            yield (SEGMENT, SHOWN, segment.eid, look, *transform(segment.node), 0)
+        for chaser in app.chasers:
+            flags = SHOWN|FLASH if chaser.node.has_color() else SHOWN
+            yield (CHASER, flags, chaser.eid, 0, *transform(chaser.node), 0)
+        for mine in app.mines:
+            flags = SHOWN if mine.cross.is_hidden() else SHOWN|BLOWN
+            yield (MINE, flags, mine.eid, 0, *transform(mine.node), mine.cross.get_sx())
+        for bullet in app.bullets:
+            yield (BULLET, SHOWN, bullet.eid, 0, *transform(bullet.node), 0)
+        explosions = {id(app.pools[name]): i for i, name in enumerate(EXPLOSIONS)}
+        for explosion in app.explosions:
+            yield (EXPLOSION, SHOWN, explosion.eid, explosions[id(explosion.pool)],
+                *transform(explosion.node), explosion.node.get_color_scale()[3])
+        for score in app.scores:
+            yield (SCORE, SHOWN, score.eid, score.score, *transform(score.node), 0)
+        for flower in app.flowers:
+            yield (FLOWER, SHOWN, flower.eid, 0, *transform(flower.node), 0)
+
+    def publish(self):
+        app = self.app
+        state = self.state
+        slots = state.slots
+        # Past ENTITIES things, the rest just isn't drawn.
+        rows = numpy.array(list(self.rows())[:ENTITIES], ENTITY)
+        i = self.slot
+        seq = int(slots["seq"][i])
+        slots["seq"][i] = seq+1
+        slots["tick"][i] = app.clock.tick
+        slots["score"][i] = app.score
+        slots["highscore"][i] = app.highscore
+        slots["lives"][i] = app.lives
+        slots["level"][i] = app.level
+        slots["wave"][i] = app.wave
+        slots["started"][i] = not app.first
+        slots["announced"][i] = app.announced
+        slots["music"][i] = app.music.get_volume()
+        slots["bg_alpha"][i] = app.bg.get_color_scale()[3]
+        slots["text"][i] = app.announcement.text.encode()[:256]
+        slots["count"][i] = len(rows)
+        slots["entities"][i, :len(rows)] = rows
+        slots["seq"][i] = seq+2
+        state.control["latest"] = i
+        state.control["written"] = self.events.written
+        self.slot = 1-i
+
+
+def run_worker(name, seed, tick_rate, main_dir):
+    ExecutionEnvironment.set_environment_variable("MAIN_DIR", main_dir)
+    import main
+    state = SharedState(name)
+    events = Events(state)
+    shared = SharedInput(state)
+    app = main.GameApp(headless=True, seed=seed, tick_rate=tick_rate, input_source=shared)
+    app.sounds = SoundEvents(events)
+    app.music.stop()
+    app.music = Music()
+    app.zaplines = ZapEvents(events)
+    publisher = Publisher(app, state, events)
+    publisher.publish()
+    control = state.control
+    control["ready"] = 1
+    parent = multiprocessing.parent_process()
+    while not control["quit"]:
+        target = int(control["target"])
+        if app.clock.tick < target:
+            while app.clock.tick < target:
+                shared.next_tick()
+                app.tick()
+            publisher.publish()
+        elif parent.is_alive():
+            time.sleep(0.0005)
+        else:
+            break
+    del control
+    state.close()
+
+
+class Reader():
+    def __init__(self, state):
+        self.state = state
+        self.read = 0
+        self.seen = None
+
+    def latest(self):
+        # The newest snapshot as (header, entities), None if it was
+        # already read.
+        slots = self.state.slots
+        for _ in range(4):
+            i = int(self.state.control["latest"])
+            seq = int(slots["seq"][i])
+            if seq&1:
+                continue
+            if (i, seq) == self.seen:
+                return None
+            header = {name: slots[name][i].item() for name in HEADER}
+            entities = slots["entities"][i, :int(slots["count"][i])].copy()
+            if int(slots["seq"][i]) == seq:
+                self.seen = (i, seq)
+                header["text"] = header["text"].decode()
+                return header, entities
+        return None
+
+    def events(self):
+        written = int(self.state.control["written"])
+        start = max(self.read, written-EVENTS)
+        self.read = written
+        if start == written:
+            return []
+        return self.state.events[numpy.arange(start, written)%EVENTS].tolist()
+
+
+class SimProcess(Reader):
+    def __init__(self, seed, tick_rate):
+        Reader.__init__(self, SharedState())
+        main_dir = ExecutionEnvironment.get_environment_variable("MAIN_DIR")
+        # Panda runs threads of its own, a new process is safer than a fork.
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(target=run_worker, daemon=True,
+            args=(self.state.memory.name, seed, tick_rate, main_dir))
+        self.process.start()
+        self.target = 0
+
+    def ready(self):
+        if not self.process.is_alive():
+            raise RuntimeError("the simulation process exited")
+        return bool(self.state.control["ready"])
+
+    def advance(self, ticks, context):
+        control = self.state.control
+        x, y = context["movement"]
+        control["x"] = x
+        control["y"] = y
+        if context["spawn"]:
+            control["presses"] += 1
+        self.target += ticks
+        control["target"] = self.target
+
+    def close(self):
+        if self.state.control is None:
+            return
+        self.state.control["quit"] = 1
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.state.close(unlink=True)
+
+
+class Mirror():
+    # Draws the worker's snapshots. Every entity id gets a node of its
+    # own while it lives, so the interpolator sees the same node move.
+    def __init__(self, app):
+        self.app = app
+        self.looks = sorted(app.models["enemies"])
+        self.nodes = {}
+        self.free = defaultdict(list)
+        self.announced = 0
+
+    def movers(self):
+        if not self.app.player.node.is_hidden():
+            yield self.app.player.node
+        for node, kind, _ in self.nodes.values():
+            if kind in (BULLET, CHASER, SCORE):
+                yield node
+
+    def dress(self, node, kind, look):
+        models = self.app.models
+        node.node().remove_all_children()
+        if kind == SEGMENT:
+            geometry = models["enemies"][self.looks[look//3]]
+            role_models(geometry)[look%3].instance_to(node)
+        elif kind == CHASER:
+            models["chasers"]["spider"].instance_to(node)
+        elif kind == MINE:
+            models["misc"]["egg"].instance_to(node)
+            cross = node.attach_new_node("cross")
+            models["lines"]["cross"].instance_to(cross)
+        elif kind == BULLET:
+            models["misc"]["bullet"].instance_to(node)
+        elif kind == EXPLOSION:
+            models["misc"][EXPLOSIONS[look]].instance_to(node)
+            node.set_transparency(True)
+        elif kind == SCORE:
+            self.app.hud.digits.number(look).instance_to(node)
+        elif kind == FLOWER:
+            models["misc"]["flower"].instance_to(node)
+
+    def take(self, kind, look):
+        if self.free[kind]:
+            entry = self.free[kind].pop()
+            entry[0].show()
+            self.app.interpolator.previous.pop(entry[0], None)
+        else:
+            parent = self.app.hud.popups if kind == SCORE else render
+            entry = [parent.attach_new_node(KIND_NAMES[kind]), kind, None]
+        if entry[2] != look:
+            self.dress(entry[0], kind, look)
+            entry[2] = look
+        return entry
+
+    def apply(self, header, entities):
+        app = self.app
+        if header["started"] and app.first:
+            app.show_game()
+        app.score = header["score"]
+        app.highscore = header["highscore"]
+        app.lives = header["lives"]
+        app.level = header["level"]
+        app.wave = header["wave"]
+        if header["announced"] != self.announced:
+            self.announced = header["announced"]
+            app.restart_text()
+        if app.announcement.text != header["text"]:
+            app.announcement.text = header["text"]
+        if app.music.get_volume() != header["music"]:
+            app.music.set_volume(header["music"])
+        app.bg.set_alpha_scale(header["bg_alpha"])
+
+        nodes = self.nodes
+        current = {}
+        transforms = numpy.hstack((entities["pos"], entities["hpr"], entities["scale"])).tolist()
+        rows = zip(entities["kind"].tolist(), entities["flags"].tolist(),
+            entities["eid"].tolist(), entities["look"].tolist(),
+            entities["extra"].tolist(), transforms)
+        for kind, flags, eid, look, extra, transform in rows:
+            if kind == PLAYER:
+                node = app.player.node
+                if flags&SHOWN:
+                    node.show()
+                else:
+                    node.hide()
+                node.set_pos_hpr_scale(*transform)
+                continue
+            entry = nodes.pop(eid, None)
+            if entry is None:
+                entry = self.take(kind, look)
+            elif entry[2] != look:
+                self.dress(entry[0], kind, look)
+                entry[2] = look
+            current[eid] = entry
+            node = entry[0]
+            node.set_pos_hpr_scale(*transform)
+            if kind == CHASER:
+                if flags&FLASH:
+                    node.set_color(1,1,1,1)
+                else:
+                    node.clear_color()
+            elif kind == MINE:
+                cross = node.get_child(1)
+                if flags&BLOWN:
+                    cross.show()
+                    cross.set_color((0,1,0,1))
+                    cross.set_scale(extra)
+                else:
+                    cross.hide()
+            elif kind == EXPLOSION:
+                node.set_alpha_scale(extra)
+        for entry in nodes.values():
+            entry[0].hide()
+            self.free[entry[1]].append(entry)
+        self.nodes = current
+
+    def play(self, events):
+        app = self.app
+        for kind, loop, key, rate, a, b, color, thickness in events:
+            if kind == SOUND_PLAY:
+                app.sounds.play(key.decode(), rate, bool(loop))
+            elif kind == SOUND_STOP:
+                app.sounds.stop(key.decode())
+            elif kind == SOUND_GROUP:
+                app.sounds.stop_group(key.decode())
+            elif kind == ZAP:
+                app.zaplines.add(a, b, color, thickness)
@@ -1,30 +1,224 @@
-def load_sounds():
-    loaded_sounds = {}
-    # 2d sounds
-    loaded_sounds["2d"] = {}
-    sounds = (
+from time import perf_counter
+from collections import OrderedDict
+
+from panda3d.core import AudioSound, AudioManager, PStatCollector
+from panda3d.core import Filename, MovieAudio, VirtualFileSystem, get_model_path
+
+
+SOUNDS = {
+    # group: folder, sounds, volume, priority, lazy
+    "2d": ("sfx/", (
         "bounce", "bullet", "die", "explosion_s", "explosion_b",
         "gameover", "lines", "zap_a", "zap_b", "combo", "extralife"
-    )
-    for sound in sounds:
-        loaded_sounds["2d"][sound] = loader.load_sfx("sfx/"+sound+".ogg")
-        loaded_sounds["2d"][sound].set_volume(2)
-    # 3d sounds
-    loaded_sounds["3d"] = {}
-    sounds = (
+    ), 2, 1, False),
+    "3d": ("sfx/", (
         "spider",
-    )
-    for sound in sounds:
-        loaded_sounds["3d"][sound] = loader.load_sfx("sfx/"+sound+".ogg")
-    # announcer
-    loaded_sounds["announce"] = {}
-    sounds = (
+    ), None, 1, False),
+    "announce": ("announcer/", (
         "butterzapper_recharge", "die", "flower_power", "game_over", "give_it_to_me",
         "goodbye", "got_you", "here_comes_flower", "little_flower", "oh_baby",
         "sexy", "so_close", "starting_game", "super_combo", "sure_why_not",
         "thats_the_stuff", "you_die"
-    )
-    for sound in sounds:
-        loaded_sounds["announce"][sound] = loader.load_sfx("announcer/"+sound+".ogg")
-        loaded_sounds["announce"][sound].set_volume(0.5)
+    ), 0.5, 3, True),
+}
+
+VOICES = {
+    # sound: how many may play at once, priority instead of the group's
+    "2d/bullet": (4, 0),
+    "2d/explosion_s": (4, 1),
+    "2d/explosion_b": (2, 1),
+    "2d/zap_a": (3, 1),
+    "2d/die": (1, 2),
+    "2d/gameover": (1, 2),
+    "2d/combo": (1, 2),
+    "2d/extralife": (1, 2),
+}
+
+
+def pcm_bytes(path):
+    # What a clip takes in memory once decoded to 16 bit samples.
+    filename = Filename(path)
+    VirtualFileSystem.get_global_ptr().resolve_filename(filename, get_model_path().get_value())
+    cursor = MovieAudio.get(filename).open()
+    if cursor is None:
+        return 0
+    return int(cursor.length()*cursor.audio_rate()*cursor.audio_channels()*2)
+
+
+def request_sounds(assets):
+    # Short effects are decoded once up front. Announcer lines are only
+    # decoded when first said, see Voices.fetch().
+    # Volume and priority are set when the sounds are loaded.
+    for group, (folder, sounds, _, _, lazy) in SOUNDS.items():
+        if lazy:
+            continue
+        for sound in sounds:
+            key = group+"/"+sound
+            voices = VOICES.get(key, (1,))[0]
+            for i in range(voices):
+                assets.sound(key+"#"+str(i), folder+sound+".ogg", AudioManager.SM_sample)
+
+
+def load_sounds(assets, cache_size):
+    loaded_sounds = Voices(cache_size=cache_size)
+    for group, (folder, sounds, volume, priority, lazy) in SOUNDS.items():
+        for sound in sounds:
+            key = group+"/"+sound
+            path = folder+sound+".ogg"
+            voices, priority = VOICES.get(key, (1, priority))
+            if lazy:
+                loaded_sounds.add_lazy(key, path, volume, priority)
+                continue
+            instances = []
+            for i in range(voices):
+                instance = assets.get(key+"#"+str(i))
+                if volume is not None:
+                    instance.set_volume(volume)
+                instances.append(instance)
+            # Extra instances share the decoded samples of the first.
+            loaded_sounds.add(key, instances, priority)
+            loaded_sounds.resident[key] = pcm_bytes(path)
+            loaded_sounds.decode_times[key] = assets.times[key+"#0"]
+    loaded_sounds.resident_level.set_level(loaded_sounds.resident_bytes())
     return loaded_sounds
+
+
+class Voice():
+    def __init__(self, key, sound, priority, started):
+        self.key = key
+        self.sound = sound
+        self.priority = priority
+        self.started = started
+
+
+class Voices():
+    # Every sound effect goes through here instead of straight to the
+    # audio manager. Triggers are collected during the frame, duplicates
+    # of the same sound merged, and played in update() within a global
+    # budget. A sound at its own cap, or any sound with the budget full,
+    # restarts its own oldest voice. Otherwise a full budget steals the
+    # oldest voice of lower priority, or drops the sound.
+    #
+    # Lazy sounds are decoded on first play and kept in an LRU cache of
+    # cache_size bytes, evicting the least recently played that isn't
+    # playing right now.
+    def __init__(self, budget=16, cache_size=512*1024):
+        self.budget = budget
+        self.cache_size = cache_size
+        self.lazy = {}
+        self.cache = OrderedDict()
+        self.resident = {}
+        self.decode_times = {}
+        self.sounds = {}
+        self.priorities = {}
+        self.playing = []
+        self.queue = {}
+        self.frame = 0
+        self.active = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.fired = 0
+        self.active_level = PStatCollector("Audio:Voices:Active")
+        self.dropped_level = PStatCollector("Audio:Voices:Dropped")
+        self.resident_level = PStatCollector("Audio:Resident")
+
+    def add(self, key, sounds, priority):
+        self.sounds[key] = sounds
+        self.priorities[key] = priority
+
+    def add_lazy(self, key, path, volume, priority):
+        self.lazy[key] = path, volume
+        self.priorities[key] = priority
+
+    def play(self, key, rate=1, loop=False):
+        self.fired += 1
+        if key in self.queue:
+            self.coalesced += 1
+        self.queue[key] = rate, loop
+
+    def stop(self, key):
+        self.queue.pop(key, None)
+        for sound in self.sounds.get(key, ()):
+            sound.stop()
+
+    def stop_group(self, group):
+        for key in self.sounds:
+            if key.startswith(group+"/"):
+                self.stop(key)
+
+    def update(self):
+        self.frame += 1
+        self.playing = [v for v in self.playing if v.sound.status() == AudioSound.PLAYING]
+        dropped = self.dropped
+        queue = sorted(self.queue.items(), key=lambda item: -self.priorities[item[0]])
+        self.queue.clear()
+        for key, (rate, loop) in queue:
+            self.start(key, rate, loop)
+        self.active = len(self.playing)
+        self.active_level.set_level(self.active)
+        self.dropped_level.set_level(self.dropped-dropped)
+
+    def start(self, key, rate, loop):
+        if key in self.lazy:
+            self.fetch(key)
+        priority = self.priorities[key]
+        voices = [v for v in self.playing if v.key == key]
+        if loop and any(v.sound.get_loop() for v in voices):
+            return
+        busy = [v.sound for v in voices]
+        free = [sound for sound in self.sounds[key] if not sound in busy]
+        if free and len(self.playing) < self.budget:
+            sound = free[0]
+        elif voices:
+            oldest = min(voices, key=lambda v: v.started)
+            self.release(oldest)
+            sound = oldest.sound
+        else:
+            victim = min(self.playing, key=lambda v: (v.priority, v.started))
+            if victim.priority >= priority:
+                self.dropped += 1
+                return
+            self.release(victim)
+            sound = free[0]
+        sound.set_loop(loop)
+        sound.set_play_rate(rate)
+        sound.play()
+        self.playing.append(Voice(key, sound, priority, self.frame))
+
+    def release(self, voice):
+        voice.sound.stop()
+        self.playing.remove(voice)
+
+    def fetch(self, key):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return
+        path, volume = self.lazy[key]
+        start = perf_counter()
+        sound = base.sfxManagerList[0].get_sound(Filename(path), False, AudioManager.SM_sample)
+        self.decode_times[key] = perf_counter()-start
+        if volume is not None:
+            sound.set_volume(volume)
+        self.sounds[key] = [sound]
+        self.resident[key] = pcm_bytes(path)
+        self.cache[key] = True
+        playing = set(v.key for v in self.playing)
+        for old in list(self.cache):
+            if sum(self.resident[k] for k in self.cache) <= self.cache_size:
+                break
+            if old != key and not old in playing:
+                del self.cache[old]
+                del self.sounds[old]
+                del self.resident[old]
+        self.resident_level.set_level(self.resident_bytes())
+
+    def resident_bytes(self):
+        return sum(self.resident.values())
+
+    def report(self):
+        lines = ["{:<36}{:>10}{:>10}".format("sound", "kb", "ms")]
+        for key, size in sorted(self.resident.items()):
+            lines.append("{:<36}{:>10.1f}{:>10.2f}".format(
+                key, size/1024, self.decode_times[key]*1000))
+        lines.append("{:<36}{:>10.1f}".format("total", self.resident_bytes()/1024))
+        return "\n".join(lines)
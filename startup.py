@@ -0,0 +1,50 @@
+import os
+from time import perf_counter
+
+
+def process_age():
+    # Seconds since the OS started this process, read from /proc on
+    # Linux. It covers starting Python itself, elsewhere the trace
+    # starts when this module is imported.
+    try:
+        with open("/proc/self/stat") as f:
+            started = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    return max(0, uptime-started/os.sysconf("SC_CLK_TCK"))
+
+
+class StartupTrace():
+    # Where the time goes between starting the process and the first
+    # frames, one mark at the end of every phase.
+    def __init__(self):
+        self.last = perf_counter()
+        self.phases = []
+        age = process_age()
+        if age is not None:
+            self.phases.append(("python", age))
+
+    def mark(self, name):
+        # The time since process start, for the summary line.
+        now = perf_counter()
+        self.phases.append((name, now-self.last))
+        self.last = now
+        return self.total()
+
+    def total(self):
+        return sum(seconds for name, seconds in self.phases)
+
+    def report(self):
+        lines = ["{:<16}{:>9}{:>9}".format("STARTUP", "MS", "TOTAL")]
+        total = 0
+        for name, seconds in self.phases:
+            total += seconds
+            lines.append("{:<16}{:>9.1f}{:>9.1f}".format(name, seconds*1000, total*1000))
+        return "\n".join(lines)
+
+
+# Made on import, main.py imports this first so the trace covers the
+# rest of its imports.
+STARTUP = StartupTrace()
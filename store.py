@@ -0,0 +1,95 @@
+import sys
+
+import numpy
+
+
+class Store():
+    # Struct of arrays for one kind of entity: every field is a typed
+    # array indexed by entity.slot, so update passes work on whole
+    # arrays. Removing swaps the last entity into the hole. The store
+    # only holds live entities, EntityList still decides the order the
+    # game walks them in.
+    def __init__(self, fields, capacity=16):
+        self.fields = fields
+        self.entities = []
+        self.arrays = {name: numpy.zeros(capacity, dtype) for name, dtype in fields}
+        self.itemsize = sum(numpy.dtype(dtype).itemsize for name, dtype in fields)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __getitem__(self, name):
+        return self.arrays[name][:len(self.entities)]
+
+    def add(self, entity):
+        slot = len(self.entities)
+        if slot == len(self.arrays[self.fields[0][0]]):
+            for name, array in self.arrays.items():
+                self.arrays[name] = numpy.concatenate((array, numpy.zeros_like(array)))
+        for array in self.arrays.values():
+            array[slot] = 0
+        entity.store = self
+        entity.slot = slot
+        self.entities.append(entity)
+
+    def select(self, mask):
+        # The entities where mask is set, in the order their EntityList
+        # walks them: destroying them in that order keeps the list in the
+        # order the game rules pick from.
+        return sorted((self.entities[i] for i in numpy.flatnonzero(mask)),
+            key=lambda entity: entity.dense_index)
+
+    def remove(self, entity):
+        slot = entity.slot
+        if slot is None:
+            return
+        last = len(self.entities)-1
+        if slot != last:
+            moved = self.entities[last]
+            self.entities[slot] = moved
+            moved.slot = slot
+            for array in self.arrays.values():
+                array[slot] = array[last]
+        self.entities.pop()
+        entity.slot = None
+
+
+class Field():
+    # An entity attribute that lives in the entity's store.
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, entity, owner):
+        if entity is None:
+            return self
+        return entity.store.arrays[self.name][entity.slot].item()
+
+    def __set__(self, entity, value):
+        entity.store.arrays[self.name][entity.slot] = value
+
+
+def entity_bytes(entity):
+    # What one entity costs on the Python side: the object, its __dict__
+    # if it has one, the floats it boxes and its row in a store.
+    size = sys.getsizeof(entity)
+    if hasattr(entity, "__dict__"):
+        size += sys.getsizeof(entity.__dict__)
+        values = list(entity.__dict__.values())
+    else:
+        names = [name for cls in type(entity).__mro__ for name in cls.__dict__.get("__slots__", ())]
+        values = [getattr(entity, name, None) for name in names]
+    size += sum(sys.getsizeof(value) for value in values if type(value) is float)
+    store = getattr(entity, "store", None)
+    if store is not None:
+        size += store.itemsize
+    return size
+
+
+def entity_report(registry):
+    lines = ["{:<12}{:>8}{:>16}".format("kind", "count", "bytes/entity")]
+    for kind, entities in registry.kinds.items():
+        live = list(entities)
+        if live:
+            size = sum(entity_bytes(entity) for entity in live)/len(live)
+            lines.append("{:<12}{:>8}{:>16.0f}".format(kind, len(live), size))
+    return "\n".join(lines)
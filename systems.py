@@ -0,0 +1,84 @@
+from time import perf_counter
+
+from panda3d.core import PStatCollector
+
+
+class System():
+    def __init__(self, name, function, sort, period, cosmetic, budget):
+        self.name = name
+        self.function = function
+        self.sort = sort
+        self.period = period
+        self.cosmetic = cosmetic
+        self.budget = budget
+        self.ms = 0
+        self.runs = 0
+        self.overruns = 0
+
+
+class Scheduler():
+    # Runs the systems of a tick in sort order. They are not Panda tasks:
+    # those run once per frame, and a frame can hold any number of ticks.
+    # A system with period n runs on every nth tick with n ticks of dt.
+    # When the ticks of a frame take longer than the budget, cosmetic
+    # systems run less often, the ones the game rules read never do.
+    def __init__(self, clock, profiler, budget=8.0, max_slowdown=8):
+        self.clock = clock
+        self.profiler = profiler
+        self.systems = []
+        self.budget = budget
+        self.max_slowdown = max_slowdown
+        self.adaptive = True
+        self.slowdown = 1
+        self.frame_ms = 0
+        self.overrun_level = PStatCollector("Systems:Overruns")
+        self.slowdown_level = PStatCollector("Systems:Slowdown")
+
+    def add(self, name, function, sort, period=1, cosmetic=False, budget=1.0):
+        system = System(name, function, sort, period, cosmetic, budget)
+        self.systems.append(system)
+        self.systems.sort(key=lambda system: system.sort)
+        return system
+
+    def run(self, system):
+        # Whether a system runs only depends on the tick, so a replay
+        # that seeks runs the same ones.
+        period = system.period
+        if system.cosmetic:
+            period *= self.slowdown
+        if self.clock.tick%period == 0:
+            self.profiler.start(system.name)
+            started = perf_counter()
+            system.function(self.clock.dt*period)
+            ms = (perf_counter()-started)*1000
+            self.profiler.stop(system.name)
+            system.ms = ms
+            system.runs += 1
+            if ms > system.budget:
+                system.overruns += 1
+            self.frame_ms += ms
+
+    def tick(self):
+        for system in self.systems:
+            self.run(system)
+
+    def end_frame(self):
+        if self.adaptive:
+            if self.frame_ms > self.budget and self.slowdown < self.max_slowdown:
+                self.slowdown *= 2
+            elif self.frame_ms < self.budget/2 and self.slowdown > 1:
+                self.slowdown //= 2
+        self.frame_ms = 0
+        self.overrun_level.set_level(self.overruns())
+        self.slowdown_level.set_level(self.slowdown)
+
+    def overruns(self):
+        return sum(system.overruns for system in self.systems)
+
+    def report(self):
+        lines = ["{:<14}{:>8}{:>8}{:>10}{:>10}".format(
+            "system", "period", "runs", "budget", "overruns")]
+        for system in self.systems:
+            lines.append("{:<14}{:>8}{:>8}{:>8.2f}ms{:>10}".format(
+                system.name, system.period, system.runs, system.budget, system.overruns))
+        return "\n".join(lines)
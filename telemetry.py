@@ -0,0 +1,111 @@
+import os
+import json
+import struct
+import threading
+
+import numpy
+
+
+# A telemetry file is a header: magic, version, tick rate and the
+# length of a JSON list describing a record, that list, and then
+# nothing but records, one per tick.
+HEADER = struct.Struct("<4sBHI")
+MAGIC = b"GFTM"
+VERSION = 1
+FIELDS = [
+    ("tick", "<u4"), ("ms", "<f4"), ("score", "<i8"), ("level", "<u2"),
+    ("wave", "<u1"), ("alive", "<u1"), ("sounds", "<u2"), ("tested", "<u4"),
+]
+
+
+class Telemetry():
+    # Per tick gameplay and timing counters. log() only stores numbers
+    # into a preallocated ring, a background thread drains it to disk
+    # in batches. There is one writer and one reader: the game only
+    # moves head, the thread only moves tail, so neither takes a lock.
+    # When the thread falls a whole ring behind, ticks are dropped
+    # instead of the game waiting.
+    def __init__(self, app, path, capacity=8192, interval=0.25):
+        self.app = app
+        self.kinds = tuple(app.entities.kinds.items())
+        self.dtype = numpy.dtype(FIELDS+[(kind, "<u2") for kind, entities in self.kinds])
+        self.ring = numpy.zeros(capacity, self.dtype)
+        self.capacity = capacity
+        # Column views made once, writing through them allocates nothing.
+        self.columns = tuple(self.ring[name] for name, dtype in FIELDS)
+        self.counts = tuple((self.ring[kind], entities) for kind, entities in self.kinds)
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.fired = 0
+        self.tested = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, "wb")
+        descr = json.dumps(self.dtype.descr).encode()
+        self.file.write(HEADER.pack(MAGIC, VERSION, app.clock.rate, len(descr))+descr)
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.drain, name="telemetry", daemon=True)
+        self.thread.start()
+
+    def log(self, seconds):
+        head = self.head
+        if head-self.tail >= self.capacity:
+            self.dropped += 1
+            return
+        app = self.app
+        slot = head%self.capacity
+        tick, ms, score, level, wave, alive, sounds, tested = self.columns
+        tick[slot] = app.clock.tick
+        ms[slot] = seconds*1000
+        score[slot] = app.score
+        level[slot] = app.level
+        wave[slot] = app.wave
+        alive[slot] = app.player.alive
+        sounds[slot] = app.sounds.fired-self.fired
+        self.fired = app.sounds.fired
+        tested[slot] = app.grid.tested+app.swarm.tested-self.tested
+        self.tested = app.grid.tested+app.swarm.tested
+        for column, entities in self.counts:
+            column[slot] = len(entities)
+        self.head = head+1
+
+    def drain(self):
+        while not self.stopping.wait(self.interval):
+            self.write()
+        self.write()
+
+    def write(self):
+        head, tail = self.head, self.tail
+        if head == tail:
+            return
+        start, end = tail%self.capacity, head%self.capacity
+        if start < end:
+            self.file.write(self.ring[start:end].tobytes())
+        else:
+            self.file.write(self.ring[start:].tobytes())
+            self.file.write(self.ring[:end].tobytes())
+        self.file.flush()
+        self.tail = head
+
+    def close(self):
+        if self.thread.is_alive():
+            self.stopping.set()
+            self.thread.join()
+        if self.file.closed:
+            return
+        # Whatever a thread that died left behind.
+        try:
+            self.write()
+        finally:
+            self.file.close()
+
+
+def read_telemetry(path):
+    # The records of a telemetry file as a numpy structured array.
+    with open(path, "rb") as f:
+        magic, version, tick_rate, size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a gridfly telemetry file".format(path))
+        dtype = numpy.dtype([tuple(field) for field in json.loads(f.read(size))])
+        return numpy.frombuffer(f.read(), dtype)
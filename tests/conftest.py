@@ -0,0 +1,27 @@
+import os
+import sys
+import shutil
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def assets_available():
+    built = os.path.join(ROOT, "built_assets", "models", "enemies.bam")
+    return os.path.exists(built) or shutil.which("blender") is not None
+
+
+@pytest.fixture(scope="session")
+def app():
+    # ShowBase can only be created once per process, so all tests that
+    # need the game share this headless instance.
+    if not assets_available():
+        pytest.skip("game assets are not built and Blender is not available")
+    from panda3d.core import ExecutionEnvironment
+    ExecutionEnvironment.set_environment_variable("MAIN_DIR", ROOT)
+    os.chdir(ROOT)
+    import main
+    return main.GameApp(headless=True, seed=0)
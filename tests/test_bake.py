@@ -0,0 +1,110 @@
+from panda3d.core import NodePath, Character, CharacterJoint, PartGroup, Mat4
+from panda3d.core import GeomVertexArrayFormat, GeomVertexFormat, GeomVertexData
+from panda3d.core import GeomVertexAnimationSpec, GeomVertexWriter, InternalName
+from panda3d.core import TransformBlendTable, TransformBlend, JointVertexTransform
+from panda3d.core import Geom, GeomNode, GeomTriangles, SparseArray, Filename
+from panda3d.core import AnimBundle, AnimBundleNode, AnimGroup
+from panda3d.core import AnimChannelMatrixXfmTable, PTA_stdfloat, CPTA_stdfloat
+from panda3d.core import load_prc_file_data, unload_prc_file
+from direct.actor.Actor import Actor
+
+from bake import bake_frames, bake_joint, baked
+
+
+def skinned(anim, joint="bone", frames=24):
+    # A triangle skinned to one joint, which goes up 0.1 every frame.
+    character = Character("skinned")
+    bundle = character.get_bundle(0)
+    bone = CharacterJoint(character, bundle, PartGroup(bundle, "<skeleton>"), joint, Mat4.ident_mat())
+    array = GeomVertexArrayFormat()
+    array.add_column(InternalName.get_vertex(), 3, Geom.NT_float32, Geom.C_point)
+    array.add_column(InternalName.get_transform_blend(), 1, Geom.NT_uint16, Geom.C_index)
+    format = GeomVertexFormat()
+    format.add_array(array)
+    spec = GeomVertexAnimationSpec()
+    spec.set_panda()
+    format.set_animation(spec)
+    vdata = GeomVertexData("skinned", GeomVertexFormat.register_format(format), Geom.UH_static)
+    table = TransformBlendTable()
+    table.add_blend(TransformBlend(JointVertexTransform(bone), 1.0))
+    table.set_rows(SparseArray.lower_on(3))
+    vdata.set_transform_blend_table(table)
+    vertex = GeomVertexWriter(vdata, "vertex")
+    blend = GeomVertexWriter(vdata, "transform_blend")
+    for point in ((0,0,0), (1,0,0), (0,1,0)):
+        vertex.add_data3(point)
+        blend.add_data1i(0)
+    triangles = GeomTriangles(Geom.UH_static)
+    triangles.add_vertices(0, 1, 2)
+    geom = Geom(vdata)
+    geom.add_primitive(triangles)
+    node = GeomNode("skinned")
+    node.add_geom(geom)
+    root = NodePath(character)
+    root.attach_new_node(node)
+    animation = AnimBundle(anim, 24, frames)
+    channel = AnimChannelMatrixXfmTable(AnimGroup(animation, "<skeleton>"), joint)
+    heights = PTA_stdfloat()
+    for frame in range(frames):
+        heights.push_back(frame*0.1)
+    channel.set_table(b'z', CPTA_stdfloat(heights))
+    root.attach_new_node(AnimBundleNode(anim, animation))
+    return root
+
+
+class Assets():
+    def __init__(self, path):
+        self.paths = {"skinned": path}
+        self.model = skinned("walk")
+
+    def get(self, name):
+        return self.model
+
+
+def test_bake_frames():
+    sequence = bake_frames(Actor(skinned("walk")), "walk")
+    assert sequence.node().get_num_frames() == 24
+    assert sequence.node().get_frame_rate() == 24
+    for frame in (0, 5, 23):
+        low, high = sequence.get_child(frame).get_tight_bounds()
+        assert abs(low.z-frame*0.1) < 1e-5 and abs(high.z-frame*0.1) < 1e-5
+    geom = sequence.get_child(5).find("**/+GeomNode").node().get_geom(0)
+    assert not geom.get_vertex_data().get_format().has_column("transform_blend")
+    assert not sequence.find("**/+Character")
+
+
+def test_bake_joint():
+    sequence = bake_joint(Actor(skinned("animation", joint="text")), "animation", "text")
+    assert [round(frame.get_z(), 5) for frame in sequence.get_children()][:3] == [0, 0.1, 0.2]
+
+
+def test_baked_loops_are_cached(app, tmp_path):
+    source = tmp_path/"skinned.bam"
+    skinned("walk").write_bam_file(str(source))
+    page = load_prc_file_data("test", "gridfly-bake-cache {}".format(tmp_path/"baked"))
+    try:
+        assets = Assets(Filename.from_os_specific(str(source)).get_fullpath())
+        first = baked(assets, "skinned", "walk", rate=2)
+        assert (tmp_path/"baked"/"skinned-walk.bam").exists()
+        assets.model = None
+        second = baked(assets, "skinned", "walk", rate=2)
+        assert second.node().get_num_frames() == 24
+        assert second.node().get_play_rate() == 2 and second.node().is_playing()
+    finally:
+        unload_prc_file(page)
+
+
+def test_animated_keeps_each_rate(app, tmp_path):
+    page = load_prc_file_data("test", "gridfly-bake-cache {}".format(tmp_path))
+    app.bake = True
+    app.baked = {}
+    try:
+        walk = app.animated("spider", "walk")
+        run = app.animated("spider", "walk", 2)
+        assert walk.get_child(0).node().get_play_rate() == 1
+        assert run.get_child(0).node().get_play_rate() == 2
+        assert app.animated("spider", "walk", 2).get_child(0).node() == run.get_child(0).node()
+    finally:
+        app.bake = False
+        app.baked = {}
+        unload_prc_file(page)
@@ -0,0 +1,25 @@
+import pytest
+
+import balance
+from balance import Results, read_results, COLUMNS
+
+
+def test_results_round_trip(tmp_path):
+    results = Results(str(tmp_path))
+    for job, curve in enumerate(([0, 50], [], [0, 10, 20])):
+        row = {name: job for name, dtype in COLUMNS}
+        row["curve"] = curve
+        results.append(row)
+    results.close()
+    columns = read_results(str(tmp_path))
+    assert columns["job"].tolist() == [0, 1, 2]
+    assert columns["curve_end"].tolist() == [2, 2, 5]
+    assert columns["curve"].tolist() == [0, 50, 0, 10, 20]
+
+
+def test_failed_worker_ends_the_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(balance, "failed", None)
+    balance.start_worker(str(tmp_path/"missing"))
+    assert "FileNotFoundError" in balance.failed
+    with pytest.raises(RuntimeError):
+        balance.play((0, 0, 0.1, 4, 1, 10))
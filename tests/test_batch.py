@@ -0,0 +1,67 @@
+import numpy
+
+from panda3d.core import NodePath, GeomNode, Geom, GeomTriangles, GeomVertexData
+from panda3d.core import GeomVertexFormat, GeomVertexWriter, GeomVertexReader
+
+from batch import Batcher
+
+
+POINTS = ((0, 0, 0), (1, 0, 0), (0, 2, 1))
+
+
+def triangle():
+    vdata = GeomVertexData("triangle", GeomVertexFormat.get_v3n3(), Geom.UH_static)
+    vertex = GeomVertexWriter(vdata, "vertex")
+    normal = GeomVertexWriter(vdata, "normal")
+    for point in POINTS:
+        vertex.add_data3(point)
+        normal.add_data3(1, 0, 0)
+    prim = GeomTriangles(Geom.UH_static)
+    prim.add_vertices(0, 1, 2)
+    geom = Geom(vdata)
+    geom.add_primitive(prim)
+    node = GeomNode("triangle")
+    node.add_geom(geom)
+    return NodePath(node)
+
+
+def drawn(root, column="vertex"):
+    geom = root.find("**/+GeomNode").node().get_geom(0)
+    reader = GeomVertexReader(geom.get_vertex_data(), column)
+    count = geom.get_primitive(0).get_num_vertices()
+    points = []
+    for i in range(count):
+        reader.set_row(geom.get_primitive(0).get_vertex(i))
+        points.append(tuple(reader.get_data3()))
+    return numpy.array(points).reshape(-1, 3, 3)
+
+
+def test_batcher_bakes_instance_transforms():
+    model = triangle()
+    nodes = []
+    for i in range(5):
+        node = NodePath("instance")
+        node.set_pos(i*3, -i, 0.5)
+        node.set_h(i*40)
+        node.set_scale(1+i*0.5, 1, 2)
+        nodes.append(node)
+    root = NodePath("root")
+    batcher = Batcher(root)
+    batcher.draw({model: nodes})
+    # One node and one Geom however many instances there are.
+    assert len(root.find_all_matches("**/+GeomNode")) == 1
+    assert root.find("**/+GeomNode").node().get_num_geoms() == 1
+    points = drawn(root)
+    assert len(points) == len(nodes)
+    for node, triangle_points in zip(nodes, points):
+        expected = [node.get_mat().xform_point(point) for point in POINTS]
+        assert numpy.allclose(triangle_points, expected, atol=1e-4)
+    # Normals only turn with the heading.
+    for node, normals in zip(nodes, drawn(root, "normal")):
+        h = numpy.radians(node.get_h())
+        assert numpy.allclose(normals, [(numpy.cos(h), numpy.sin(h), 0)]*3, atol=1e-4)
+
+    batcher.draw({model: nodes[:2]})
+    assert len(drawn(root)) == 2
+    batcher.draw({})
+    assert root.find("**/+GeomNode").is_hidden()
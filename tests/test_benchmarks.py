@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import tracemalloc
+
+import pytest
+
+
+# Wall clock numbers, so these only run when asked for: pytest -m benchmark.
+# They are compared against GRIDFLY_BENCH_BASELINE when it is set, and
+# GRIDFLY_BENCH_UPDATE=1 writes this run's numbers there instead. The
+# report goes to GRIDFLY_BENCH_REPORT, or a temporary directory.
+pytestmark = pytest.mark.benchmark
+
+BASELINE = os.environ.get("GRIDFLY_BENCH_BASELINE")
+REPORT = os.environ.get("GRIDFLY_BENCH_REPORT")
+TICKS = int(os.environ.get("GRIDFLY_BENCH_TICKS", 600))
+TOLERANCE = float(os.environ.get("GRIDFLY_BENCH_TOLERANCE", 0.25))
+UPDATE = os.environ.get("GRIDFLY_BENCH_UPDATE") == "1"
+
+
+def start_level(app, level, wave):
+    app.start()
+    app.level = level
+    app.wave = wave
+    app.lives = 10**6
+    app.start(spawn=True)
+
+
+def random_pos():
+    from rng import uniform
+    return (uniform(-25, 25), uniform(0, 50), 0)
+
+
+def setup_wave(app):
+    start_level(app, 15, 4)
+
+def sustain_wave(app):
+    pass
+
+
+def setup_flowerpower(app):
+    start_level(app, 10, 4)
+
+def sustain_flowerpower(app):
+    app.player.flowerpower = 5
+
+
+def setup_zap_storm(app):
+    start_level(app, 15, 4)
+
+def sustain_zap_storm(app):
+    for i in range(5):
+        app.player.zap()
+
+
+def setup_mines(app):
+    start_level(app, 5, 1)
+
+def sustain_mines(app):
+    while len(app.mines) < 50:
+        app.pools["mine"].get(random_pos()).time = 1.5
+
+
+def setup_churn(app):
+    start_level(app, 1, 1)
+
+def sustain_churn(app):
+    from rng import uniform
+    for i in range(20):
+        app.pools["explosion_a"].get(random_pos(), speed=uniform(1, 2))
+        app.pools["score"].get(random_pos(), 50)
+
+
+def setup_swarm(app):
+    from objects import Chaser
+    start_level(app, 6, 1)
+    while len(app.chasers) < 300:
+        app.chasers.append(Chaser(app.models["chasers"]["spider"], random_pos(), 6))
+
+def sustain_swarm(app):
+    pass
+
+
+SCENARIOS = {
+    "level15_wave4": (setup_wave, sustain_wave),
+    "flowerpower": (setup_flowerpower, sustain_flowerpower),
+    "zap_storm": (setup_zap_storm, sustain_zap_storm),
+    "mines_50": (setup_mines, sustain_mines),
+    "explosion_score_churn": (setup_churn, sustain_churn),
+    "spider_swarm_300": (setup_swarm, sustain_swarm),
+}
+
+
+def run(app, name, ticks):
+    import rng
+    setup, sustain = SCENARIOS[name]
+    rng.seed(name)
+    setup(app)
+    for i in range(30):
+        sustain(app)
+        app.task_mgr.step()
+    times = []
+    clock = time.perf_counter
+    for i in range(ticks):
+        start = clock()
+        sustain(app)
+        app.task_mgr.step()
+        times.append(clock()-start)
+    return times
+
+
+def percentile(times, p):
+    times = sorted(times)
+    return times[min(len(times)-1, int(len(times)*p/100))]*1000
+
+
+def measure(app, name):
+    times = run(app, name, TICKS)
+    tracemalloc.start()
+    run(app, name, TICKS//4)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "ticks_per_second": len(times)/sum(times),
+        "p50_ms": percentile(times, 50),
+        "p95_ms": percentile(times, 95),
+        "p99_ms": percentile(times, 99),
+        "peak_kb": peak/1024,
+    }
+
+
+def regressions(result, baseline):
+    failed = []
+    if result["ticks_per_second"] < baseline["ticks_per_second"]*(1-TOLERANCE):
+        failed.append("ticks_per_second")
+    for key in ("p95_ms", "peak_kb"):
+        if result[key] > baseline[key]*(1+TOLERANCE):
+            failed.append(key)
+    return failed
+
+
+@pytest.fixture(scope="module")
+def baseline(tmp_path_factory):
+    data = {}
+    if BASELINE and not UPDATE:
+        with open(BASELINE) as f:
+            data = json.load(f)
+    results = {}
+    yield data, results
+    report = REPORT or str(tmp_path_factory.mktemp("bench")/"bench_output.txt")
+    with open(report, "w") as f:
+        f.write("{:<24}{:>10}{:>10}{:>10}{:>10}{:>12}\n".format(
+            "scenario", "ticks/s", "p50 ms", "p95 ms", "p99 ms", "peak kb"))
+        for name, r in results.items():
+            f.write("{:<24}{:>10.1f}{:>10.3f}{:>10.3f}{:>10.3f}{:>12.1f}\n".format(
+                name, r["ticks_per_second"], r["p50_ms"], r["p95_ms"], r["p99_ms"], r["peak_kb"]))
+    if BASELINE and UPDATE:
+        if os.path.exists(BASELINE):
+            with open(BASELINE) as f:
+                data = json.load(f)
+        data.update(results)
+        with open(BASELINE, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+
+
+@pytest.mark.parametrize("name", list(SCENARIOS))
+def test_benchmark(app, baseline, name):
+    data, results = baseline
+    result = measure(app, name)
+    results[name] = result
+    if name in data:
+        failed = regressions(result, data[name])
+        assert not failed, "{} regressed on {}: {} (baseline {})".format(
+            name, ", ".join(failed), result, data[name])
@@ -0,0 +1,29 @@
+from clock import SimClock
+
+
+def test_ticks_per_frame():
+    clock = SimClock(60)
+    assert [clock.advance(1/240) for i in range(8)] == [0, 0, 0, 1, 0, 0, 0, 1]
+    assert clock.advance(1/30) == 2
+    assert clock.advance(1) == clock.max_ticks
+    assert clock.skipped == 60-clock.max_ticks
+
+
+def test_high_refresh_runs_same_ticks(app):
+    app.start()
+    app.interpolate = True
+    globalClock.set_frame_rate(240)
+    try:
+        tick = app.clock.tick
+        blended = 0
+        for i in range(240):
+            app.task_mgr.step()
+            for node, pos, shown in app.interpolator.current:
+                if shown != pos:
+                    blended += 1
+        assert app.clock.tick-tick == 60
+        assert blended
+    finally:
+        globalClock.set_frame_rate(app.clock.rate)
+        app.interpolator.restore()
+        app.interpolate = False
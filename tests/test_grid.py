@@ -0,0 +1,42 @@
+import random
+
+from grid import SpatialGrid
+
+
+def brute_force(points, pos, radius):
+    hits = []
+    for entity, (x, y) in points.items():
+        if ((x-pos[0])**2 + (y-pos[1])**2)**0.5 < radius:
+            hits.append(entity)
+    return hits
+
+
+def test_query_matches_linear_scan():
+    rng = random.Random(29)
+    grid = SpatialGrid([25, 50])
+    points = {}
+    for i in range(300):
+        points[i] = (rng.uniform(-30, 30), rng.uniform(-5, 110))
+        grid.insert("segments", i, points[i])
+    for i in range(0, 300, 3):
+        points[i] = (rng.uniform(-30, 30), rng.uniform(-5, 60))
+        grid.move(i, points[i])
+    for i in range(0, 300, 7):
+        grid.remove(i)
+        del points[i]
+    for i in range(500):
+        pos = (rng.uniform(-30, 30), rng.uniform(-5, 60))
+        radius = rng.choice((0.5, 0.8, 3))
+        assert grid.query("segments", pos, radius) == brute_force(points, pos, radius)
+
+
+def test_layers_and_rect():
+    grid = SpatialGrid([25, 50])
+    grid.insert("mines", "a", (0, 10))
+    grid.insert("mines", "b", (10, 10.1))
+    grid.insert("chasers", "c", (0, 10))
+    assert grid.query("mines", (0, 10), 1) == ["a"]
+    assert grid.query_rect("mines", -50, 9.9, 50, 10.2) == ["a", "b"]
+    grid.clear("mines")
+    assert grid.query("mines", (0, 10), 1) == []
+    assert grid.query("chasers", (0, 10), 1) == ["c"]
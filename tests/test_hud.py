@@ -0,0 +1,18 @@
+def test_any_score_popup(app):
+    app.start()
+    score = app.score
+    popup = app.pools["score"].get((0, 10, 0), 50*31)
+    assert app.score == score+1550
+    assert popup.node.get_num_children() == 1
+    assert app.hud.digits.number(1550).get_tight_bounds() is not None
+    popup.destroy()
+    app.entities.flush()
+
+
+def test_hud_only_regenerates_on_change(app):
+    app.hud.update(1, 2, 3)
+    text = app.hud.info.get_internal_geom()
+    app.hud.update(1, 2, 3)
+    assert app.hud.info.get_internal_geom() == text
+    app.hud.update(1, 12, 3)
+    assert "SCORE:12" in app.hud.info.text
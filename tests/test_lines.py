@@ -0,0 +1,33 @@
+from panda3d.core import NodePath, GeomVertexReader, RenderModeAttrib
+
+from lines import LineBuffer
+
+
+def test_line_buffer_draws_one_geom_per_thickness():
+    lines = LineBuffer(NodePath("root"), capacity=2)
+    node = lines.node.node()
+    assert node.get_num_geoms() == 3
+    thickness = [node.get_geom_state(i).get_attrib(RenderModeAttrib).get_thickness()
+        for i in range(node.get_num_geoms())]
+    assert thickness == [3, 4, 5]
+
+    lines.add((0, 0, 0), (1, 0, 0), (1, 0, 0, 1), 5)
+    lines.add((0, 1, 0), (1, 1, 0), (0, 1, 0, 1), 3)
+    lines.add((0, 2, 0), (1, 2, 0), (0, 0, 1, 1), 3)
+    assert len(lines) == 3
+    lines.update()
+    # Past the capacity the buffer grows, every thickness draws a range
+    # of the same vertex table.
+    counts = [node.get_geom(i).get_primitive(0).get_num_vertices() for i in range(3)]
+    assert counts == [4, 0, 2]
+    vdata = node.get_geom(0).get_vertex_data()
+    assert all(node.get_geom(i).get_vertex_data() == vdata for i in range(3))
+    assert vdata.get_num_rows() >= 6
+    reader = GeomVertexReader(vdata, "vertex")
+    reader.set_row(node.get_geom(2).get_primitive(0).get_vertex(1))
+    assert tuple(reader.get_data3()) == (1, 0, 0)
+
+    lines.clear()
+    assert len(lines) == 0
+    lines.update()
+    assert [node.get_geom(i).get_primitive(0).get_num_vertices() for i in range(3)] == [0, 0, 0]
@@ -0,0 +1,11 @@
+def test_loader_progress_and_preload(app):
+    from loading import AssetLoader
+    assets = AssetLoader()
+    assets.model("misc", "models/misc.bam")
+    assets.sound("bullet", "sfx/bullet.ogg")
+    assert not assets.preload("bg_99", "models/bg_99.bam")
+    assets.wait()
+    assert assets.done()
+    assert assets.progress() == (2, 2)
+    assert assets.get("misc").find("**/bullet")
+    assert "title" in app.startup and "assets ready" in app.startup
@@ -0,0 +1,90 @@
+import socket
+
+from netplay import Lockstep, encode, decode
+
+
+class Lossy():
+    # A socket that drops every nth packet it sends.
+    def __init__(self, sock, every):
+        self.sock = sock
+        self.every = every
+        self.count = 0
+
+    def sendto(self, packet, address):
+        self.count += 1
+        if self.count%self.every:
+            self.sock.sendto(packet, address)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+def pair(lossy=0, **kwargs):
+    sockets = []
+    for i in range(2):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        sockets.append(sock)
+    a, b = (sock.getsockname() for sock in sockets)
+    if lossy:
+        sockets = [Lossy(sock, lossy) for sock in sockets]
+    return Lockstep(sockets[0], b, 0, **kwargs), Lockstep(sockets[1], a, 1, **kwargs)
+
+
+def context(number, tick):
+    return {"movement": ((tick//7%3-1)*number, 0.5), "spawn": tick%50 == number}
+
+
+def play(peers, ticks, state=lambda number, tick: 0):
+    played = ([], [])
+    ticks_of = [0, 0]
+    for step in range(ticks*20):
+        for number, peer in enumerate(peers):
+            tick = ticks_of[number]
+            if tick < ticks and peer.allow(tick, 1):
+                peer.checksum = lambda number=number, tick=tick: state(number, tick)
+                peer.begin_tick(tick, context(number, tick))
+                played[number].append((peer.input(0), peer.input(1)))
+                ticks_of[number] += 1
+            peer.send()
+        if ticks_of == [ticks, ticks]:
+            break
+    return played
+
+
+def test_delta_frames():
+    frames = [(0, 0, False), (0, 0, False), (127, -3, True), (127, 5, False)]
+    data = encode(frames)
+    assert len(data) == 7
+    assert decode(data, 0, len(frames)) == frames
+
+
+def test_lockstep_plays_the_same_inputs():
+    peers = pair(delay=3, check_every=30, tick_rate=30)
+    played = play(peers, 300)
+    assert len(played[0]) == len(played[1]) == 300
+    assert played[0] == played[1]
+    # Input of tick t shows up at t+delay.
+    assert played[0][103][1]["spawn"] == context(1, 100)["spawn"]
+    assert played[0][2][0] == {"movement": (0, 0), "spawn": False}
+    assert peers[0].checked > 0 and peers[0].desync is None
+    assert peers[0].bytes_sent/peers[0].ticks < 60
+    assert peers[0].latency() == 100
+    for peer in peers:
+        peer.close()
+
+
+def test_lockstep_survives_loss():
+    peers = pair(lossy=3, delay=2)
+    played = play(peers, 200)
+    assert played[0] == played[1] and len(played[0]) == 200
+    for peer in peers:
+        peer.close()
+
+
+def test_desync_is_found():
+    peers = pair(check_every=20)
+    play(peers, 100, lambda number, tick: number if tick >= 40 else 7)
+    assert peers[0].desync == 40 and peers[1].desync == 40
+    for peer in peers:
+        peer.close()
@@ -0,0 +1,50 @@
+from pools import Pool, pool_report
+
+
+class Node():
+    def __init__(self):
+        self.hidden = False
+        self.removed = False
+
+    def hide(self):
+        self.hidden = True
+
+    def show(self):
+        self.hidden = False
+
+    def remove_node(self):
+        self.removed = True
+
+
+class Thing():
+    made = 0
+
+    def __init__(self, kind):
+        Thing.made += 1
+        self.kind = kind
+        self.node = Node()
+        self.spawned = None
+
+    def spawn(self, pos):
+        self.spawned = pos
+
+
+def test_pool_reuses_after_warm():
+    Thing.made = 0
+    pool = Pool(Thing, "bullet", cap=3)
+    pool.warm(5)
+    assert len(pool.free) == 3 and Thing.made == 3
+    things = [pool.get(i) for i in range(3)]
+    assert Thing.made == 3 and (pool.hits, pool.misses) == (3, 0)
+    assert all(thing.pool is pool and thing.kind == "bullet" for thing in things)
+    assert [thing.spawned for thing in things] == [0, 1, 2]
+    assert not any(thing.node.hidden for thing in things)
+    extra = pool.get(3)
+    assert Thing.made == 4 and (pool.hits, pool.misses) == (3, 1)
+    for thing in things+[extra]:
+        pool.put(thing)
+    # Past the cap, released things are dropped instead of kept.
+    assert len(pool.free) == 3 and extra.node.removed
+    assert all(thing.node.hidden for thing in things)
+    assert pool.get(4) is things[-1]
+    assert "bullet" in pool_report({"bullet": pool}).splitlines()[1]
@@ -0,0 +1,46 @@
+from registry import Registry
+
+
+class Thing():
+    def __init__(self, name):
+        self.name = name
+        self.released = False
+
+    def release(self):
+        self.released = True
+
+
+def test_deferred_swap_remove():
+    registry = Registry()
+    things = registry.kind("things")
+    a, b, c = Thing("a"), Thing("b"), Thing("c")
+    for thing in (a, b, c):
+        things.append(thing)
+    seen = []
+    for thing in things:
+        seen.append(thing.name)
+        things.remove(a)
+        things.remove(b)
+    assert seen == ["a", "c"]
+    assert len(things) == 1
+    assert not a.released
+    things.flush()
+    assert a.released and b.released
+    assert things.dense == [c] and c.dense_index == 0
+
+
+def test_generational_ids():
+    registry = Registry()
+    things = registry.kind("things")
+    a = Thing("a")
+    things.append(a)
+    old = a.eid
+    things.remove(a)
+    things.flush()
+    b = Thing("b")
+    things.append(b)
+    assert registry.get(old) is None
+    assert registry.get(b.eid) is b
+    things.clear()
+    assert len(things) == 0 and b.released
+    assert registry.get(b.eid) is None
@@ -0,0 +1,112 @@
+import os
+import sys
+import zlib
+import pickle
+import subprocess
+
+import pytest
+
+from headless import ScriptedInput
+from replay import Recorder, Replay, checksum, save_state, load_state
+from replay import encode_state, decode_state
+
+
+def wander(tick):
+    # Changes direction every half second and respawns when dead.
+    step = tick//30
+    return ((step*7)%3-1, (step*5)%3-1), tick%90 == 0
+
+
+def play(app, log, ticks, seek=None):
+    app.replay = log
+    app.input = log
+    try:
+        if seek is not None:
+            log.seek(app, seek)
+            ticks -= app.clock.tick
+        app.simulate(ticks)
+    finally:
+        app.replay = None
+        app.input = log.source
+
+
+def test_seek_matches_full_run(app, tmp_path):
+    import rng
+    path = str(tmp_path/"session.gfr")
+    app.start()
+    rng.seed(7)
+    recorder = Recorder(path, 7, keyframe_every=300)
+    recorder.source = ScriptedInput(wander)
+    start = app.clock.tick
+    play(app, recorder, 1000)
+    recorder.close()
+    end = app.clock.tick
+    expected = checksum(app)
+
+    replay = Replay(path)
+    assert [tick-start for tick, offset in replay.index] == [0, 300, 600, 900]
+    replay.source = ScriptedInput()
+    play(app, replay, end, seek=start+650)
+    assert checksum(app) == expected
+
+    play(app, replay, end, seek=start)
+    assert checksum(app) == expected
+    replay.close()
+
+
+# Replays a session in a windowed game, where the game is only made once
+# the assets are in, and prints the tick it landed on.
+WINDOWED = """
+import sys
+from panda3d.core import load_prc_file_data, ExecutionEnvironment
+load_prc_file_data("test", "window-type offscreen\\nload-display p3tinydisplay\\n"
+    "audio-library-name null\\ngridfly-display-cache\\n")
+ExecutionEnvironment.set_environment_variable("MAIN_DIR", sys.argv[1])
+import main
+from headless import ScriptedInput
+from replay import Replay
+replay = Replay(sys.argv[2])
+app = main.GameApp(seed=replay.seed, tick_rate=replay.tick_rate, replay=replay,
+    input_source=ScriptedInput())
+app.seek(int(sys.argv[3]))
+while not app.loaded:
+    app.task_mgr.step()
+print("seeked", app.clock.tick, len(app.segments))
+"""
+
+
+def test_windowed_replay_seeks_once_loaded(app, tmp_path):
+    import rng
+    path = str(tmp_path/"session.gfr")
+    app.start()
+    rng.seed(3)
+    recorder = Recorder(path, 3, keyframe_every=300)
+    recorder.source = ScriptedInput(wander)
+    start = app.clock.tick
+    play(app, recorder, 400)
+    recorder.close()
+    root = os.getcwd()
+    result = subprocess.run([sys.executable, "-c", WINDOWED, root, path, str(start+350)],
+        cwd=root, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    tick, segments = result.stdout.split("seeked ")[1].split()
+    assert int(tick) == start+350 and int(segments) > 0
+
+
+def test_keyframes_are_checked(app):
+    app.start()
+    app.simulate(100)
+    expected = checksum(app)
+    state = decode_state(encode_state(save_state(app)))
+    load_state(app, state)
+    assert checksum(app) == expected
+    with pytest.raises(ValueError):
+        decode_state(zlib.compress(pickle.dumps(save_state(app))))
+    state["segments"][0][1] = "os.system"
+    with pytest.raises(ValueError):
+        decode_state(encode_state(state))
+    state = save_state(app)
+    assert state["centipedes"]
+    del state["segments"][:]
+    with pytest.raises(ValueError):
+        decode_state(encode_state(state))
@@ -0,0 +1,22 @@
+from objects import make_centipede, role_models, HEAD, MID, TAIL
+
+
+def test_segments_share_role_models(app):
+    app.start()
+    geometry = app.models["enemies"]["cent3"]
+    models = role_models(geometry)
+    centipede = make_centipede(geometry, length=5)
+    roles = [segment.role for segment in centipede.segments]
+    assert roles == [HEAD, MID, MID, MID, MID, TAIL]
+    for segment in centipede.segments:
+        if not app.batch_render:
+            assert segment.node.get_num_children() == 1
+            assert segment.node.get_child(0).node() == models[segment.role].node()
+
+    # A split makes a new head and tail, only those swap their model.
+    children = [segment.node.get_child(0) for segment in centipede.segments]
+    centipede.segments[2].destroy()
+    app.entities.flush()
+    assert centipede.segments[1].role == TAIL
+    assert centipede.segments[1].node.get_child(0).node() == models[TAIL].node()
+    assert centipede.segments[0].node.get_child(0) == children[0]
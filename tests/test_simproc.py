@@ -0,0 +1,80 @@
+import time
+
+from simproc import SharedState, Events, SoundEvents, Publisher, Reader, Mirror
+from simproc import SimProcess, SOUND_PLAY, SEGMENT
+
+
+def test_snapshot_round_trip(app):
+    app.start()
+    app.simulate(300)
+    state = SharedState()
+    try:
+        events = Events(state)
+        sounds = SoundEvents(events)
+        sounds.play("2d/bullet", rate=1.5)
+        sounds.stop("2d/lines")
+        publisher = Publisher(app, state, events)
+        publisher.publish()
+        reader = Reader(state)
+        header, entities = reader.latest()
+        assert reader.latest() is None
+        assert header["tick"] == app.clock.tick
+        assert header["score"] == app.score
+        segments = entities[entities["kind"] == SEGMENT]
+        assert len(segments) == len(app.segments)
+        assert sorted(segments["eid"].tolist()) == sorted(s.eid for s in app.segments)
+        played = reader.events()
+        assert [(kind, key) for kind, loop, key, *rest in played] == [(SOUND_PLAY, b"2d/bullet")]
+
+        mirror = Mirror(app)
+        mirror.apply(header, entities)
+        for segment in app.segments:
+            node = mirror.nodes[segment.eid][0]
+            assert (node.get_pos()-segment.node.get_pos()).length() < 1e-4
+        for node, kind, look in mirror.nodes.values():
+            node.remove_node()
+        del header, entities, segments
+    finally:
+        state.close(unlink=True)
+
+
+def test_worker_process_simulates(app):
+    sim = SimProcess(1, 60)
+    try:
+        deadline = time.time()+60
+        while not sim.ready():
+            assert time.time() < deadline
+            time.sleep(0.01)
+        sim.advance(120, {"movement": (0, 0), "spawn": True})
+        header = None
+        while not header or header["tick"] < 120:
+            assert time.time() < deadline
+            snapshot = sim.latest()
+            if snapshot:
+                header, entities = snapshot
+        assert header["started"] and header["lives"] == 3
+        assert (entities["kind"] == SEGMENT).any()
+        assert any(kind == SOUND_PLAY for kind, *rest in sim.events())
+    finally:
+        sim.close()
+
+
+def test_spawn_press_without_a_tick(app):
+    sim = SimProcess(1, 60)
+    try:
+        deadline = time.time()+60
+        while not sim.ready():
+            assert time.time() < deadline
+            time.sleep(0.01)
+        sim.advance(0, {"movement": (0, 0), "spawn": True})
+        for tick in range(30):
+            sim.advance(1, {"movement": (0, 0), "spawn": False})
+        header = None
+        while not header or header["tick"] < 30:
+            assert time.time() < deadline
+            snapshot = sim.latest()
+            if snapshot:
+                header, entities = snapshot
+        assert header["started"] and header["lives"] == 3
+    finally:
+        sim.close()
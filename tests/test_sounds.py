@@ -0,0 +1,88 @@
+from panda3d.core import AudioSound
+
+from sounds import Voices
+
+
+class Sound():
+    def __init__(self):
+        self.playing = False
+        self.plays = 0
+        self.loop = False
+
+    def status(self):
+        return AudioSound.PLAYING if self.playing else AudioSound.READY
+
+    def play(self):
+        self.playing = True
+        self.plays += 1
+
+    def stop(self):
+        self.playing = False
+
+    def set_loop(self, loop):
+        self.loop = loop
+
+    def get_loop(self):
+        return self.loop
+
+    def set_play_rate(self, rate):
+        pass
+
+
+def test_budget_caps_and_priorities():
+    voices = Voices(budget=3)
+    bullets = [Sound(), Sound()]
+    voices.add("2d/bullet", bullets, 0)
+    voices.add("2d/die", [Sound()], 2)
+    voices.add("announce/oh_baby", [Sound()], 3)
+
+    for i in range(5):
+        voices.play("2d/bullet")
+    voices.update()
+    assert voices.coalesced == 4
+    assert voices.active == 1
+
+    voices.play("2d/bullet")
+    voices.update()
+    voices.play("2d/bullet")
+    voices.update()
+    # At its cap of two the oldest bullet restarts.
+    assert voices.active == 2
+    assert bullets[0].plays == 2
+
+    voices.play("2d/die")
+    voices.play("announce/oh_baby")
+    voices.update()
+    # The announcer takes a bullet's voice, the budget holds.
+    assert voices.active == 3
+    assert voices.dropped == 0
+    assert sum(bullet.playing for bullet in bullets) == 1
+
+    voices.play("2d/bullet")
+    voices.update()
+    # With the budget full a bullet can only restart its own voice.
+    assert voices.active == 3
+    assert voices.dropped == 0
+
+    voices.stop("2d/bullet")
+    voices.add("2d/bounce", [Sound()], 1)
+    voices.add("2d/zap_a", [Sound()], 1)
+    voices.play("2d/bounce")
+    voices.update()
+    voices.play("2d/zap_a")
+    voices.update()
+    assert voices.dropped == 1
+
+
+def test_lazy_sounds_stay_under_cache_size(app):
+    voices = Voices(cache_size=200*1024)
+    for name in ("oh_baby", "sexy", "so_close", "got_you"):
+        voices.add_lazy("announce/"+name, "announcer/"+name+".ogg", 0.5, 3)
+    for name in ("oh_baby", "sexy", "so_close", "got_you", "sexy"):
+        voices.play("announce/"+name)
+        voices.update()
+        assert voices.resident_bytes() <= 200*1024
+    assert list(voices.cache)[-1] == "announce/sexy"
+    assert not "announce/oh_baby" in voices.sounds
+    assert len(voices.decode_times) == 4
+    assert "total" in voices.report()
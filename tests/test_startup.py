@@ -0,0 +1,49 @@
+from panda3d.core import ConfigVariableInt, load_prc_file_data, unload_prc_file
+
+from display import load_display_mode, pick_display_mode
+from startup import StartupTrace
+
+
+class Info():
+    modes = ((640, 480), (1024, 768), (1920, 1080))
+
+    def getTotalDisplayModes(self):
+        return len(self.modes)
+
+    def getDisplayModeWidth(self, idx):
+        return self.modes[idx][0]
+
+    def getDisplayModeHeight(self, idx):
+        return self.modes[idx][1]
+
+
+class Pipe():
+    def getDisplayInformation(self):
+        return Info()
+
+
+class Window():
+    def requestProperties(self, properties):
+        self.size = properties.get_x_size(), properties.get_y_size()
+
+
+def test_display_mode_is_cached(tmp_path):
+    page = load_prc_file_data("test", "gridfly-display-cache {}".format(tmp_path/"display.prc"))
+    try:
+        assert not load_display_mode()
+        win = Window()
+        pick_display_mode(win, Pipe())
+        assert win.size == (1920, 1080)
+        assert load_display_mode()
+        assert list(ConfigVariableInt("win-size")) == [1920, 1080]
+    finally:
+        unload_prc_file(page)
+
+
+def test_startup_trace():
+    trace = StartupTrace()
+    trace.mark("one")
+    total = trace.mark("two")
+    assert [name for name, seconds in trace.phases][-2:] == ["one", "two"]
+    assert total == trace.total() >= 0
+    assert "two" in trace.report().splitlines()[-1]
@@ -0,0 +1,44 @@
+from store import Store, Field, entity_bytes
+
+
+class Thing():
+    __slots__ = ("name", "store", "slot")
+    time = Field()
+
+    def __init__(self, name):
+        self.name = name
+        self.slot = None
+
+
+def test_store_swaps_on_remove():
+    store = Store((("time", "f8"), ("pos", ("f4", 2))), capacity=2)
+    things = [Thing(i) for i in range(5)]
+    for i, thing in enumerate(things):
+        store.add(thing)
+        thing.time = i
+    assert len(store) == 5 and store["pos"].shape == (5, 2)
+    store.remove(things[1])
+    store.remove(things[1])
+    assert things[1].slot is None
+    assert [thing.name for thing in store.entities] == [0, 4, 2, 3]
+    for thing in store.entities:
+        assert store.entities[thing.slot] is thing
+        assert thing.time == thing.name
+    store["time"][:] += 1
+    assert things[4].time == 5
+    assert entity_bytes(things[4]) >= store.itemsize == 16
+
+
+def test_mines_blow_and_expire(app):
+    app.start()
+    app.lives = 10**6
+    mine = app.pools["mine"].get((10, 20, 0))
+    app.update_mines(0.5)
+    assert not mine.blown and mine.cross.is_hidden()
+    app.update_mines(0.6)
+    assert mine.blown and not mine.cross.is_hidden()
+    assert abs(mine.cross.get_sx()-(1+12*0.6)) < 1e-5
+    for i in range(8):
+        app.update_mines(0.5)
+    assert not mine.alive
+    assert mine.slot is None
@@ -0,0 +1,59 @@
+import numpy
+
+from objects import Chaser
+
+
+def spawn(app, pos):
+    chaser = Chaser(app.models["chasers"]["spider"], pos, 6)
+    app.chasers.append(chaser)
+    return chaser
+
+
+def test_swarm_chases_and_spreads(app):
+    import rng
+    app.start()
+    app.lives = 10**6
+    rng.seed(3)
+    for i in range(199):
+        spawn(app, (rng.uniform(-25, 25), rng.uniform(30, 50), 0))
+    player = app.player.node.get_pos()
+    before = [(c.node.get_pos()-player).length() for c in app.chasers]
+    for i in range(30):
+        app.player.alive = True
+        app.swarm.update()
+    after = [(c.node.get_pos()-player).length() for c in app.chasers]
+    assert sum(after) < sum(before)
+    pos = app.swarm["pos"]
+    offset = pos[:, None, :]-pos[None, :, :]
+    d2 = (offset*offset).sum(axis=2)+numpy.eye(len(pos))*100
+    assert d2.min() > 0.1*0.1
+    for chaser in app.chasers:
+        x, y, z = chaser.node.get_pos()
+        assert numpy.allclose((x, y), app.swarm["pos"][chaser.slot], atol=1e-4)
+
+
+def test_bullet_flashes_one_chaser(app):
+    app.start()
+    app.bullets.clear()
+    chaser = next(iter(app.chasers))
+    pos = chaser.node.get_pos()
+    pos.y -= 1
+    bullet = app.pools["bullet"].get(pos)
+    app.swarm.update()
+    assert not bullet.alive
+    assert chaser.node.has_color()
+    app.swarm.update()
+    assert not chaser.node.has_color()
+
+
+def test_removal_keeps_slots(app):
+    app.start()
+    chasers = [spawn(app, (x, 40, 0)) for x in range(-10, 10, 2)]
+    for chaser in chasers[::3]:
+        chaser.destroy()
+    app.entities.flush()
+    assert len(app.swarm) == len(app.chasers)
+    for chaser in app.chasers:
+        assert app.swarm.entities[chaser.slot] is chaser
+        x, y, z = chaser.node.get_pos()
+        assert tuple(app.swarm["pos"][chaser.slot]) == (x, y)
@@ -0,0 +1,29 @@
+from clock import SimClock
+from profiler import FrameProfiler
+from systems import Scheduler
+
+
+def test_order_periods_and_slowdown():
+    clock = SimClock(60)
+    scheduler = Scheduler(clock, FrameProfiler(), budget=1.0)
+    ran = []
+    scheduler.add("scores", lambda dt: ran.append(("scores", dt)), 20, period=2, cosmetic=True)
+    scheduler.add("player", lambda dt: ran.append(("player", dt)), 10)
+    for i in range(4):
+        scheduler.tick()
+        clock.tick += 1
+    assert [name for name, dt in ran] == ["player", "scores", "player", "player", "scores", "player"]
+    assert ("scores", clock.dt*2) in ran
+
+    # Over budget: only the cosmetic system slows down.
+    scheduler.frame_ms = 5
+    scheduler.end_frame()
+    assert scheduler.slowdown == 2
+    ran.clear()
+    for i in range(8):
+        scheduler.tick()
+        clock.tick += 1
+    assert [name for name, dt in ran].count("player") == 8
+    assert [name for name, dt in ran].count("scores") == 2
+    scheduler.end_frame()
+    assert scheduler.slowdown == 1
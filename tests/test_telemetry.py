@@ -0,0 +1,50 @@
+import tracemalloc
+
+import numpy
+
+from telemetry import Telemetry, read_telemetry
+
+
+def test_telemetry_round_trip(app, tmp_path):
+    path = str(tmp_path/"telemetry.bin")
+    app.start()
+    app.telemetry = telemetry = Telemetry(app, path, capacity=64, interval=0.01)
+    try:
+        for i in range(200):
+            app.task_mgr.step()
+    finally:
+        app.telemetry = None
+        telemetry.close()
+    records = read_telemetry(path)
+    assert len(records)+telemetry.dropped == 200
+    assert (numpy.diff(records["tick"]) > 0).all()
+    assert records["segments"][-1] == len(app.segments)
+    assert records["score"][-1] == app.score
+
+
+def test_logging_does_not_allocate(app, tmp_path):
+    telemetry = Telemetry(app, str(tmp_path/"telemetry.bin"), capacity=4096, interval=60)
+    try:
+        telemetry.log(0.001)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(2000):
+            telemetry.log(0.001)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert after-before < 512
+    finally:
+        telemetry.close()
+
+
+def test_close_writes_without_the_thread(app, tmp_path):
+    path = str(tmp_path/"telemetry.bin")
+    telemetry = Telemetry(app, path, capacity=64, interval=60)
+    telemetry.stopping.set()
+    telemetry.thread.join()
+    for i in range(10):
+        telemetry.log(0.001)
+    telemetry.close()
+    telemetry.close()
+    assert telemetry.file.closed
+    assert len(read_telemetry(path)) == 10